@@ -11,6 +11,9 @@ class Settings(BaseSettings):
 
     # OpenRouter
     openrouter_api_key: str
+    openrouter_max_concurrency: int = 16  # одновременных async запросов к OpenRouter
+    perplexity_rpm: int = 300  # запросов в минуту к Perplexity (верификация НПА)
+    openrouter_model_rpm: int = 600  # запросов в минуту к одной модели OpenRouter (async)
 
     # Google Custom Search API
     google_api_key: str = ""
@@ -33,6 +36,8 @@ class Settings(BaseSettings):
 
     # File upload
     max_file_size: int = 25 * 1024 * 1024  # 25 MB
+    max_batch_files: int = 20  # файлов в одном пакетном запросе
+    max_batch_size: int = 100 * 1024 * 1024  # 100 MB суммарно на пакетный запрос
     max_audio_duration: int = 300  # 5 minutes in seconds (for quick transcription)
 
     # Long audio transcription (for court recordings)
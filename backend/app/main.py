@@ -1,13 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
 from app.routers import auth, query, consilium, files, admin, chats, transcriptions
+from app.services.openrouter import close_async_client
+from app.services.file_processor import shutdown_pdf_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Закрываем общий HTTP клиент OpenRouter и пул разбора PDF
+    await close_async_client()
+    shutdown_pdf_pool()
+
 
 app = FastAPI(
     title="SGC Legal AI",
     description="AI-ассистент юридической службы Сибирской генерирующей компании",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -5,10 +5,16 @@ import json
 from fastapi import APIRouter, HTTPException, Header, UploadFile, File
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 
 from app.database import validate_session
-from app.services.file_processor import process_file, detect_file_type, get_file_summary
+from app.services.file_processor import (
+    process_file,
+    process_files_batch,
+    detect_file_type,
+    get_file_summary,
+    count_words,
+)
 from app.services.audio_transcription import (
     transcribe_long_audio,
     transcribe_audio_simple,
@@ -94,6 +100,78 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
 
 
+class BatchUploadResponse(BaseModel):
+    success: bool
+    files: List[FileUploadResponse] = []
+    error: Optional[str] = None
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_files_batch(
+    files: List[UploadFile] = File(...),
+    authorization: str = Header(None)
+):
+    """
+    Загрузить и обработать несколько файлов за один запрос
+    Изображения распознаются пачкой одним запросом к модели
+    """
+    session = get_session_from_token(authorization)
+
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много файлов. Максимум: {settings.max_batch_files}"
+        )
+
+    # Размеры частей multipart известны до чтения: слишком большой пакет
+    # отклоняется, не загружая файлы в память
+    total_size_detail = f"Суммарный размер файлов слишком большой. Максимум: {settings.max_batch_size // (1024*1024)} МБ"
+    if sum(file.size or 0 for file in files) > settings.max_batch_size:
+        raise HTTPException(status_code=413, detail=total_size_detail)
+
+    items = []
+    total_size = 0
+    for file in files:
+        content = await file.read()
+        if len(content) > settings.max_file_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Файл {file.filename} слишком большой. Максимум: {settings.max_file_size // (1024*1024)} МБ"
+            )
+        total_size += len(content)
+        if total_size > settings.max_batch_size:
+            raise HTTPException(status_code=413, detail=total_size_detail)
+        if detect_file_type(file.filename) == 'unknown':
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неподдерживаемый тип файла: {file.filename}"
+            )
+        items.append((content, file.filename))
+
+    results = await process_files_batch(items)
+
+    responses = []
+    for (_, filename), (extracted_text, file_type, error) in zip(items, results):
+        if error:
+            responses.append(FileUploadResponse(success=False, file_type=file_type, error=error))
+            continue
+        if not extracted_text or not extracted_text.strip():
+            responses.append(FileUploadResponse(
+                success=False,
+                file_type=file_type,
+                error=f"Не удалось извлечь текст из файла {filename}"
+            ))
+            continue
+        responses.append(FileUploadResponse(
+            success=True,
+            file_type=file_type,
+            extracted_text=extracted_text,
+            summary=get_file_summary(extracted_text, file_type, filename)
+        ))
+
+    return BatchUploadResponse(success=True, files=responses)
+
+
 @router.get("/supported")
 async def get_supported_formats():
     """Получить список поддерживаемых форматов"""
@@ -184,7 +262,7 @@ async def transcribe_audio_file(
 
                 if progress.stage == "complete" and progress.partial_text:
                     event_data["text"] = progress.partial_text
-                    event_data["word_count"] = len(progress.partial_text.split())
+                    event_data["word_count"] = count_words(progress.partial_text)
 
                 yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
 
@@ -252,5 +330,5 @@ async def transcribe_audio_simple_endpoint(
         text=result.text,
         duration_seconds=result.duration_seconds,
         chunks_processed=result.chunks_processed,
-        word_count=len(result.text.split()) if result.text else 0
+        word_count=count_words(result.text) if result.text else 0
     )
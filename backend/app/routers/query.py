@@ -9,6 +9,7 @@ from typing import Optional, List
 from datetime import datetime
 from enum import Enum
 import json
+import orjson
 
 from app.config import settings
 from app.database import (
@@ -23,7 +24,7 @@ from app.database import (
     save_chat_message_to_session
 )
 import time
-from app.services.openrouter import chat_completion_stream
+from app.services.openrouter import chat_completion_stream_async
 from app.services.docx_generator import create_response_docx
 from app.services import perplexity
 from app.services.npa_verification import (
@@ -128,7 +129,7 @@ async def single_query(
             if user_query:
                 yield f"data: {json.dumps({'stage': 'classifying', 'message': 'Определение типа задачи...'}, ensure_ascii=False)}\n\n"
                 try:
-                    task_type = classify_task(
+                    task_type = await classify_task(
                         user_message=user_query,
                         has_file_context=bool(request.file_context),
                         file_name=None  # TODO: pass file name if available
@@ -149,7 +150,7 @@ async def single_query(
                 yield f"data: {json.dumps({'stage': 'search', 'message': 'Поиск актуальной информации...'}, ensure_ascii=False)}\n\n"
 
                 try:
-                    search_results = perplexity.search(user_query + NPA_SEARCH_PROMPT_ADDITION)
+                    search_results = await perplexity.search_async(user_query + NPA_SEARCH_PROMPT_ADDITION)
                     yield f"data: {json.dumps({'stage': 'search_complete', 'message': 'Поиск завершён'}, ensure_ascii=False)}\n\n"
                 except Exception as e:
                     yield f"data: {json.dumps({'stage': 'search_error', 'message': f'Ошибка поиска: {str(e)}'}, ensure_ascii=False)}\n\n"
@@ -161,7 +162,7 @@ async def single_query(
                 if npa_references:
                     yield f"data: {json.dumps({'stage': 'npa_verify', 'message': f'Верификация {len(npa_references)} НПА...'}, ensure_ascii=False)}\n\n"
                     try:
-                        verified_npa_list = await verify_npa_references(npa_references, max_concurrent=2)
+                        verified_npa_list = await verify_npa_references(npa_references)
                         yield f"data: {json.dumps({'stage': 'npa_verify_complete', 'message': 'Верификация НПА завершена'}, ensure_ascii=False)}\n\n"
                     except Exception as e:
                         yield f"data: {json.dumps({'stage': 'npa_verify_error', 'message': f'Ошибка верификации НПА: {str(e)}'}, ensure_ascii=False)}\n\n"
@@ -211,10 +212,10 @@ async def single_query(
                 messages.append({"role": m.role, "content": content})
 
             # Stream response from LLM
-            for chunk in chat_completion_stream(model, messages, max_tokens=max_tokens):
+            async for chunk in chat_completion_stream_async(model, messages, max_tokens=max_tokens):
                 yield f"data: {chunk}\n\n"
                 try:
-                    parsed = json.loads(chunk)
+                    parsed = orjson.loads(chunk)
                     delta = parsed.get("choices", [{}])[0].get("delta", {}).get("content", "")
                     full_response += delta
                 except:
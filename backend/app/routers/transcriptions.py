@@ -22,7 +22,7 @@ from app.services.audio_transcription import (
     transcribe_long_audio,
     TranscriptionProgress,
 )
-from app.services.file_processor import detect_file_type
+from app.services.file_processor import detect_file_type, count_words
 from app.config import settings
 
 router = APIRouter(prefix="/api/transcriptions", tags=["transcriptions"])
@@ -224,7 +224,7 @@ async def transcribe_and_save(
 
                 if progress.stage == "complete" and progress.partial_text:
                     final_text = progress.partial_text
-                    final_word_count = len(progress.partial_text.split())
+                    final_word_count = count_words(progress.partial_text)
                     event_data["text"] = final_text
                     event_data["word_count"] = final_word_count
 
@@ -4,14 +4,17 @@ Supports long audio files (1-2 hours) by splitting into chunks
 """
 import os
 import tempfile
-import base64
 import asyncio
 from typing import AsyncGenerator, Tuple, Optional
 from dataclasses import dataclass
 import httpx
+import orjson
+import pybase64
 from pydub import AudioSegment
 
 from app.config import settings
+from app.services.file_processor import count_words
+from app.services.openrouter import get_async_client, OPENROUTER_API_URL
 
 
 @dataclass
@@ -100,37 +103,32 @@ async def transcribe_chunk_gemini(
 
     for attempt in range(MAX_RETRIES):
         try:
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.openrouter_api_key}",
-                        "Content-Type": "application/json",
-                        "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-                        "X-Title": "SGC Legal AI"
-                    },
-                    json={
-                        "model": settings.model_file_processor,
-                        "messages": messages,
-                        "max_tokens": 16000,
-                    }
-                )
+            client = get_async_client()
+            response = await client.post(
+                OPENROUTER_API_URL,
+                content=orjson.dumps({
+                    "model": settings.model_file_processor,
+                    "messages": messages,
+                    "max_tokens": 16000,
+                }),
+                timeout=300.0
+            )
 
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    return content.strip()
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+                return content.strip()
 
-                # Handle rate limiting or server errors with retry
-                if response.status_code in [429, 500, 502, 503, 504]:
-                    last_error = f"API error {response.status_code}"
-                    if attempt < MAX_RETRIES - 1:
-                        await asyncio.sleep(RETRY_DELAY_SECONDS * (2 ** attempt))
-                        continue
+            # Handle rate limiting or server errors with retry
+            if response.status_code in [429, 500, 502, 503, 504]:
+                last_error = f"API error {response.status_code}"
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(RETRY_DELAY_SECONDS * (2 ** attempt))
+                    continue
 
-                # Non-retryable error
-                error_text = response.text
-                raise Exception(f"Gemini API error: {response.status_code} - {error_text}")
+            # Non-retryable error
+            error_text = response.text
+            raise Exception(f"Gemini API error: {response.status_code} - {error_text}")
 
         except httpx.TimeoutException:
             last_error = "Таймаут запроса"
@@ -177,11 +175,11 @@ def split_audio_into_chunks(
                 chunk_path = tempfile.mktemp(suffix='.mp3')
                 audio.export(chunk_path, format='mp3', bitrate='128k')
                 with open(chunk_path, 'rb') as f:
-                    audio_base64 = base64.b64encode(f.read()).decode('utf-8')
+                    audio_base64 = pybase64.b64encode(f.read()).decode('utf-8')
                 os.unlink(chunk_path)
                 return [(audio_base64, 'mp3')], duration_seconds
             else:
-                audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+                audio_base64 = pybase64.b64encode(audio_content).decode('utf-8')
                 return [(audio_base64, audio_format)], duration_seconds
 
         # Split into chunks
@@ -196,7 +194,7 @@ def split_audio_into_chunks(
 
             # Read and encode to base64
             with open(chunk_path, 'rb') as f:
-                chunk_base64 = base64.b64encode(f.read()).decode('utf-8')
+                chunk_base64 = pybase64.b64encode(f.read()).decode('utf-8')
 
             chunks.append((chunk_base64, 'mp3'))
 
@@ -271,7 +269,7 @@ async def transcribe_long_audio(
         yield TranscriptionProgress(
             stage="complete",
             progress=1.0,
-            message=f"Транскрибация завершена. {len(full_text.split())} слов.",
+            message=f"Транскрибация завершена. {count_words(full_text)} слов.",
             partial_text=full_text
         )
 
@@ -7,7 +7,7 @@ import re
 from typing import List, Dict, Any, Optional, Callable, Awaitable
 from datetime import datetime
 
-from app.services.openrouter import chat_completion
+from app.services.openrouter import chat_completion_async
 from app.config import settings
 from app.services.npa_verification import (
     extract_npa_references_regex,
@@ -212,7 +212,7 @@ async def stage_1_parallel_gather(question: str) -> tuple[Dict[str, Any], Dict[s
         return []
 
     if npa_references:
-        tasks.append(verify_npa_references(npa_references, max_concurrent=2))
+        tasks.append(verify_npa_references(npa_references))
     else:
         tasks.append(empty_npa_list())
 
@@ -267,11 +267,7 @@ async def stage_1_parallel_gather(question: str) -> tuple[Dict[str, Any], Dict[s
 
 async def get_search_results(model_id: str, messages: List[Dict]) -> Dict:
     """Получить результаты поиска от Perplexity"""
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: chat_completion(model_id, messages, stream=False, max_tokens=4096)
-    )
+    response = await chat_completion_async(model_id, messages, stream=False, max_tokens=4096)
     content = response["choices"][0]["message"]["content"]
     tokens = response.get("usage", {}).get("total_tokens", 0)
     return {"content": content, "tokens": tokens}
@@ -279,8 +275,6 @@ async def get_search_results(model_id: str, messages: List[Dict]) -> Dict:
 
 async def get_model_opinion(model_id: str, messages: List[Dict]) -> Dict:
     """Получить ответ от конкретной модели с поддержкой reasoning"""
-    loop = asyncio.get_event_loop()
-
     # Включаем reasoning для thinking-моделей
     reasoning_effort = None
     max_tokens = 8192  # По умолчанию для обычных моделей
@@ -292,14 +286,11 @@ async def get_model_opinion(model_id: str, messages: List[Dict]) -> Dict:
         # 16384 * 0.2 = ~3200 токенов на ответ
         max_tokens = 16384
 
-    response = await loop.run_in_executor(
-        None,
-        lambda: chat_completion(
-            model_id, messages,
-            stream=False,
-            max_tokens=max_tokens,
-            reasoning_effort=reasoning_effort
-        )
+    response = await chat_completion_async(
+        model_id, messages,
+        stream=False,
+        max_tokens=max_tokens,
+        reasoning_effort=reasoning_effort
     )
     content = response["choices"][0]["message"]["content"]
     tokens = response.get("usage", {}).get("total_tokens", 0)
@@ -376,11 +367,7 @@ async def stage_2_peer_review(question: str, opinions: Dict[str, Any], search_re
     messages = [{"role": "user", "content": review_prompt}]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(CONSILIUM_MODELS["reviewer"], messages, stream=False, max_tokens=4096)
-        )
+        response = await chat_completion_async(CONSILIUM_MODELS["reviewer"], messages, stream=False, max_tokens=4096)
         content = response["choices"][0]["message"]["content"]
 
         json_match = re.search(r'\{[\s\S]*\}', content)
@@ -525,15 +512,11 @@ D. ПРАКТИЧЕСКИЕ РЕКОМЕНДАЦИИ
     messages = [{"role": "user", "content": synthesis_prompt}]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(
-                CONSILIUM_MODELS["chairman"], messages,
-                stream=False,
-                max_tokens=8192,
-                reasoning_effort="high"
-            )
+        response = await chat_completion_async(
+            CONSILIUM_MODELS["chairman"], messages,
+            stream=False,
+            max_tokens=8192,
+            reasoning_effort="high"
         )
         raw_content = response["choices"][0]["message"]["content"]
         return clean_markdown(raw_content)
@@ -580,11 +563,7 @@ async def stage_2_extract_cases(opinions: Dict[str, Any]) -> List[Dict]:
     ]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(CONSILIUM_MODELS["chairman"], messages, stream=False)
-        )
+        response = await chat_completion_async(CONSILIUM_MODELS["chairman"], messages, stream=False)
         content = response["choices"][0]["message"]["content"]
 
         # Парсим JSON из ответа
@@ -598,6 +577,10 @@ async def stage_2_extract_cases(opinions: Dict[str, Any]) -> List[Dict]:
     return []
 
 
+# Сколько дел одновременно проверяется через Perplexity
+CASE_VERIFY_CONCURRENCY = 4
+
+
 async def stage_3_verify_cases(cases: List[Dict]) -> List[Dict]:
     """
     Стадия 3: Верификация судебных дел через Perplexity Sonar Pro
@@ -605,19 +588,20 @@ async def stage_3_verify_cases(cases: List[Dict]) -> List[Dict]:
     if not cases:
         return []
 
-    verified_cases = []
+    semaphore = asyncio.Semaphore(CASE_VERIFY_CONCURRENCY)
 
-    for case in cases:
+    async def verify_case(case: Dict) -> Optional[Dict]:
         case_number = case.get("case_number", "")
         if not case_number:
-            continue
+            return None
 
         # Проверяем через Perplexity
-        try:
-            perplexity_result = await verify_with_perplexity(case_number)
-        except Exception as e:
-            logger.error(f"Perplexity verification error for {case_number}: {e}")
-            perplexity_result = {"error": str(e), "exists": False}
+        async with semaphore:
+            try:
+                perplexity_result = await verify_with_perplexity(case_number)
+            except Exception as e:
+                logger.error(f"Perplexity verification error for {case_number}: {e}")
+                perplexity_result = {"error": str(e), "exists": False}
 
         # Определяем статус на основе Perplexity
         perplexity_exists = perplexity_result.get("exists", False)
@@ -630,7 +614,7 @@ async def stage_3_verify_cases(cases: List[Dict]) -> List[Dict]:
         else:
             status = "NOT_FOUND"
 
-        verified_cases.append({
+        return {
             **case,
             "status": status,
             "verification_source": "perplexity",
@@ -640,9 +624,11 @@ async def stage_3_verify_cases(cases: List[Dict]) -> List[Dict]:
                 "sources": perplexity_result.get("sources", []),
                 "actual_info": perplexity_result.get("actual_info", "")
             }
-        })
+        }
 
-    return verified_cases
+    # Дела проверяются параллельно, порядок результатов сохраняется
+    results = await asyncio.gather(*(verify_case(case) for case in cases))
+    return [result for result in results if result is not None]
 
 
 async def verify_with_perplexity(case_number: str) -> Dict:
@@ -664,11 +650,7 @@ async def verify_with_perplexity(case_number: str) -> Dict:
     messages = [{"role": "user", "content": verification_prompt}]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(CONSILIUM_MODELS["verifier"], messages, stream=False)
-        )
+        response = await chat_completion_async(CONSILIUM_MODELS["verifier"], messages, stream=False)
         content = response["choices"][0]["message"]["content"]
 
         json_match = re.search(r'\{[\s\S]*?\}', content)
@@ -741,11 +723,7 @@ async def stage_4_peer_review(
     messages = [{"role": "user", "content": review_prompt}]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(CONSILIUM_MODELS["chairman"], messages, stream=False)
-        )
+        response = await chat_completion_async(CONSILIUM_MODELS["chairman"], messages, stream=False)
         content = response["choices"][0]["message"]["content"]
 
         json_match = re.search(r'\{[\s\S]*\}', content)
@@ -846,11 +824,7 @@ async def stage_5_final_synthesis(
     messages = [{"role": "user", "content": synthesis_prompt}]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(CONSILIUM_MODELS["chairman"], messages, stream=False, max_tokens=8192)
-        )
+        response = await chat_completion_async(CONSILIUM_MODELS["chairman"], messages, stream=False, max_tokens=8192)
         raw_content = response["choices"][0]["message"]["content"]
         # Очищаем маркдаун из ответа
         return clean_markdown(raw_content)
@@ -76,17 +76,8 @@ def create_response_docx(
         created_at: Document creation date
         title: Custom title (if None, will be "ПРАВОВОЕ ЗАКЛЮЧЕНИЕ" or auto-generated for transcriptions)
     """
-    doc = Document()
-
-    # Set up page margins (left 3cm, others 2cm)
-    for section in doc.sections:
-        section.left_margin = Cm(3)
-        section.right_margin = Cm(2)
-        section.top_margin = Cm(1.5)
-        section.bottom_margin = Cm(1.5)
-
-    # Set up styles
-    _setup_styles(doc)
+    # Clone pre-built template (margins and styles already applied)
+    doc = Document(io.BytesIO(_TEMPLATE_BYTES))
 
     # Header with logo
     if os.path.exists(LOGO_PATH):
@@ -256,6 +247,29 @@ def _setup_styles(doc: Document):
     style.paragraph_format.space_after = Pt(4)
 
 
+def _build_template_bytes() -> bytes:
+    """Build the base document (page margins + styles) once and serialize it"""
+    doc = Document()
+
+    # Set up page margins (left 3cm, others 2cm)
+    for section in doc.sections:
+        section.left_margin = Cm(3)
+        section.right_margin = Cm(2)
+        section.top_margin = Cm(1.5)
+        section.bottom_margin = Cm(1.5)
+
+    # Set up styles
+    _setup_styles(doc)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+# Serialized base document, cloned for every export
+_TEMPLATE_BYTES = _build_template_bytes()
+
+
 def _clean_text_for_docx(text: str) -> str:
     """Remove duplicate headers and clean up text before parsing"""
     # Remove "ПРАВОВОЕ ЗАКЛЮЧЕНИЕ" header anywhere in text (on its own line)
@@ -2,67 +2,73 @@
 File processing service for multimodal input
 """
 import os
-import tempfile
-import base64
-from typing import Tuple
-import docx
+import asyncio
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple, List, Iterator, AsyncIterator
+import orjson
+import pybase64
+from lxml import etree
 import pdfplumber
 import fitz  # PyMuPDF
 from openpyxl import load_workbook
 from io import BytesIO
-import requests
 from app.config import settings
+from app.services.openrouter import get_async_client, OPENROUTER_API_URL
+
+
+# Расширение -> тип файла
+_EXT_TO_TYPE = {
+    **dict.fromkeys(('docx', 'doc'), 'document'),
+    'pdf': 'pdf',
+    **dict.fromkeys(('xlsx', 'xls', 'xlsm'), 'spreadsheet'),
+    **dict.fromkeys(('txt', 'md', 'markdown'), 'text'),
+    **dict.fromkeys(('jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff'), 'image'),
+    **dict.fromkeys(('mp3', 'wav', 'ogg', 'm4a', 'webm', 'mp4', 'flac', 'aac'), 'audio'),
+}
+
+_AUDIO_MIME = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'm4a': 'audio/mp4',
+    'mp4': 'audio/mp4',
+    'webm': 'audio/webm',
+    'flac': 'audio/flac',
+    'aac': 'audio/aac',
+}
+
+_IMAGE_MIME = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+    'tiff': 'image/tiff',
+    'webp': 'image/webp'
+}
+
+
+def _file_ext(filename: str) -> str:
+    """Расширение файла в нижнем регистре (без точки)"""
+    return filename.rpartition('.')[2].lower()
 
 
 def detect_file_type(filename: str) -> str:
     """Определить тип файла по расширению"""
-    ext = filename.lower().split('.')[-1]
-
-    if ext in ['docx', 'doc']:
-        return 'document'
-    elif ext == 'pdf':
-        return 'pdf'
-    elif ext in ['xlsx', 'xls', 'xlsm']:
-        return 'spreadsheet'
-    elif ext in ['txt', 'md', 'markdown']:
-        return 'text'
-    elif ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff']:
-        return 'image'
-    elif ext in ['mp3', 'wav', 'ogg', 'm4a', 'webm', 'mp4', 'flac', 'aac']:
-        return 'audio'
-    else:
-        return 'unknown'
+    return _EXT_TO_TYPE.get(_file_ext(filename), 'unknown')
 
 
 def get_audio_mime_type(filename: str) -> str:
     """Получить MIME тип для аудио файла"""
-    ext = filename.lower().split('.')[-1]
-    mime_types = {
-        'mp3': 'audio/mpeg',
-        'wav': 'audio/wav',
-        'ogg': 'audio/ogg',
-        'm4a': 'audio/mp4',
-        'mp4': 'audio/mp4',
-        'webm': 'audio/webm',
-        'flac': 'audio/flac',
-        'aac': 'audio/aac',
-    }
-    return mime_types.get(ext, 'audio/mpeg')
+    return _AUDIO_MIME.get(_file_ext(filename), 'audio/mpeg')
 
 
 def get_image_mime_type(filename: str) -> str:
     """Получить MIME тип для изображения"""
-    ext = filename.lower().split('.')[-1]
-    mime_types = {
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg',
-        'png': 'image/png',
-        'gif': 'image/gif',
-        'bmp': 'image/bmp',
-        'tiff': 'image/tiff',
-        'webp': 'image/webp'
-    }
-    return mime_types.get(ext, 'image/png')
+    return _IMAGE_MIME.get(_file_ext(filename), 'image/png')
 
 
 async def process_file(file_content: bytes, filename: str) -> Tuple[str, str]:
@@ -73,11 +79,11 @@ async def process_file(file_content: bytes, filename: str) -> Tuple[str, str]:
     file_type = detect_file_type(filename)
 
     if file_type == 'document':
-        text = extract_docx(file_content)
+        text = await asyncio.to_thread(extract_docx, file_content)
     elif file_type == 'pdf':
         text = await extract_pdf(file_content)
     elif file_type == 'spreadsheet':
-        text = extract_excel(file_content)
+        text = await asyncio.to_thread(extract_excel, file_content)
     elif file_type == 'text':
         text = file_content.decode('utf-8', errors='ignore')
     elif file_type == 'image':
@@ -90,26 +96,137 @@ async def process_file(file_content: bytes, filename: str) -> Tuple[str, str]:
     return text, file_type
 
 
-def extract_docx(content: bytes) -> str:
-    """Извлечь текст из DOCX"""
-    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-        tmp.write(content)
-        tmp_path = tmp.name
+def _batch_error(filename: str, error: BaseException) -> str:
+    """Сообщение об ошибке обработки одного файла пакета"""
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"Ошибка обработки файла {filename}: {error}"
+
+
+async def process_files_batch(files: List[Tuple[bytes, str]]) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Обработать несколько файлов за раз.
+    Изображения отправляются в Gemini пачками (один запрос на IMAGE_BATCH_SIZE штук),
+    остальные файлы обрабатываются параллельно через process_file.
+    Ошибка одного файла не прерывает пакет: она возвращается в его элементе
+    Returns: [(extracted_text, file_type, error), ...] в порядке входных файлов
+    """
+    results: List[Tuple[str, str, Optional[str]]] = [None] * len(files)
+    image_indices = []
+    tasks = []
+    task_indices = []
+
+    for i, (content, filename) in enumerate(files):
+        if detect_file_type(filename) == 'image':
+            image_indices.append(i)
+        else:
+            tasks.append(process_file(content, filename))
+            task_indices.append(i)
+
+    if image_indices:
+        tasks.append(extract_images_batch([files[i] for i in image_indices]))
+
+    outputs = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for i, output in zip(task_indices, outputs):
+        filename = files[i][1]
+        if isinstance(output, BaseException):
+            results[i] = ('', detect_file_type(filename), _batch_error(filename, output))
+        else:
+            results[i] = (*output, None)
+    if image_indices:
+        images_output = outputs[-1]
+        for n, i in enumerate(image_indices):
+            if isinstance(images_output, BaseException):
+                results[i] = ('', 'image', _batch_error(files[i][1], images_output))
+            else:
+                results[i] = (images_output[n], 'image', None)
+
+    return results
+
+
+# Пространство имён WordprocessingML
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_P = f'{W_NS}p'
+W_TBL = f'{W_NS}tbl'
+W_TR = f'{W_NS}tr'
+W_TC = f'{W_NS}tc'
+W_T = f'{W_NS}t'
+W_TAB = f'{W_NS}tab'
+W_BR = f'{W_NS}br'
+W_CR = f'{W_NS}cr'
+W_R = f'{W_NS}r'
+W_HYPERLINK = f'{W_NS}hyperlink'
+W_TYPE = f'{W_NS}type'
+
+# Парсер для XML из загруженных файлов: без раскрытия сущностей и сетевых запросов
+DOCX_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+
+
+def _docx_paragraph_runs(p):
+    """Прогоны абзаца: прямые w:r и w:r внутри w:hyperlink (как в python-docx)"""
+    for child in p.iterchildren(W_R, W_HYPERLINK):
+        if child.tag == W_R:
+            yield child
+        else:
+            yield from child.iterchildren(W_R)
+
+
+def _docx_paragraph_text(p) -> str:
+    """
+    Собрать текст абзаца (аналог Paragraph.text в python-docx)
+    Берутся только прямые w:t/w:tab/w:br/w:cr прогонов: текст надписей внутри
+    w:drawing / mc:AlternateContent не дублируется и не склеивается с абзацем
+    """
+    parts = []
+    for run in _docx_paragraph_runs(p):
+        for el in run.iterchildren(W_T, W_TAB, W_BR, W_CR):
+            if el.tag == W_T:
+                if el.text:
+                    parts.append(el.text)
+            elif el.tag == W_TAB:
+                parts.append('\t')
+            elif el.tag == W_CR or el.get(W_TYPE, 'textWrapping') == 'textWrapping':
+                # Разрывы страницы и колонки, как в python-docx, текстом не считаются
+                parts.append('\n')
+    return ''.join(parts)
 
-    try:
-        doc = docx.Document(tmp_path)
-        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
 
-        # Также извлекаем текст из таблиц
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = ' | '.join([cell.text.strip() for cell in row.cells if cell.text.strip()])
-                if row_text:
-                    paragraphs.append(row_text)
+def _docx_cell_text(cell) -> str:
+    """Текст ячейки таблицы: абзацы через перевод строки"""
+    return '\n'.join(_docx_paragraph_text(p) for p in cell.iterchildren(W_P))
 
-        return '\n\n'.join(paragraphs)
-    finally:
-        os.unlink(tmp_path)
+
+def extract_docx(content: bytes) -> str:
+    """
+    Извлечь текст из DOCX
+    Читает word/document.xml напрямую, без построения объектной модели python-docx
+    """
+    with zipfile.ZipFile(BytesIO(content)) as z:
+        with z.open('word/document.xml') as f:
+            root = etree.parse(f, DOCX_XML_PARSER).getroot()
+
+    body = root.find(f'{W_NS}body')
+    if body is None:
+        return ''
+
+    out = []
+    out.extend(
+        text for text in map(_docx_paragraph_text, body.iterchildren(W_P))
+        if text and not text.isspace()
+    )
+
+    # Также извлекаем текст из таблиц
+    for table in body.iterchildren(W_TBL):
+        for row in table.iterchildren(W_TR):
+            cells = [
+                s for s in (_docx_cell_text(cell).strip() for cell in row.iterchildren(W_TC))
+                if s
+            ]
+            if cells:
+                out.append(' | '.join(cells))
+
+    return '\n\n'.join(out)
 
 
 def extract_excel(content: bytes) -> str:
@@ -169,46 +286,122 @@ def extract_excel(content: bytes) -> str:
     return "\n\n".join(result_parts)
 
 
-async def extract_pdf(content: bytes) -> str:
-    """
-    Извлечь текст из PDF
-    Сначала пробует pdfplumber, если текст не извлёкся - использует OCR через Gemini
-    """
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-        tmp.write(content)
-        tmp_path = tmp.name
+# PDF длиннее этого числа страниц разбираются в отдельном процессе
+PDF_PROCESS_POOL_MIN_PAGES = 10
+# Верхняя граница числа процессов: в контейнере os.cpu_count() - ядра хоста
+PDF_POOL_MAX_WORKERS = 4
+PDF_POOL_WORKERS = min(PDF_POOL_MAX_WORKERS, os.cpu_count() or 1)
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Get or create process pool for parsing large PDFs"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        # forkserver: fork многопоточного процесса uvicorn (пулы httpx/requests,
+        # потоки to_thread) может унаследовать захваченные блокировки
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _pdf_pool
+
 
-    try:
-        # Попробовать извлечь текст напрямую
-        text_parts = []
-        with pdfplumber.open(tmp_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
+def shutdown_pdf_pool():
+    """Stop PDF worker processes (called on app shutdown)"""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
 
-                # Извлекаем таблицы
-                tables = page.extract_tables()
-                for table in tables:
-                    for row in table:
-                        row_text = ' | '.join([str(cell) if cell else '' for cell in row])
-                        if row_text.strip():
-                            text_parts.append(row_text)
 
-        extracted_text = '\n\n'.join(text_parts)
+def _pdf_page_count(content: bytes) -> int:
+    """Число страниц PDF (PyMuPDF читает только xref, без разбора содержимого)"""
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        return len(doc)
+
+
+def _extract_pdf_pages(content: bytes, start: int, stop: Optional[int]) -> List[str]:
+    """
+    Извлечь текст и таблицы со страниц [start, stop) (блокирующий вызов)
+    Текст берётся через PyMuPDF, pdfplumber открывается только для страниц с линиями разметки
+    """
+    pages = []
+    table_pages = []
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        stop = len(doc) if stop is None else min(stop, len(doc))
+        for page_num in range(start, stop):
+            page = doc[page_num]
+            page_text = page.get_text().rstrip()
+            pages.append([page_text] if page_text else [])
+
+            # Таблицы ищем только на страницах с векторной графикой (линиями)
+            if page.get_drawings():
+                table_pages.append(page_num)
+
+    if table_pages:
+        with pdfplumber.open(BytesIO(content)) as pdf:
+            for page_num in table_pages:
+                page = pdf.pages[page_num]
+                if page.edges:
+                    for table in page.find_tables():
+                        for row in table.extract():
+                            row_text = ' | '.join([str(cell) if cell else '' for cell in row])
+                            if row_text.strip():
+                                pages[page_num - start].append(row_text)
+
+                # Освобождаем кэш разобранных объектов страницы
+                page.close()
+
+    return [part for parts in pages for part in parts]
+
+
+def extract_pdf_text(content: bytes) -> str:
+    """Извлечь текстовый слой и таблицы PDF (блокирующий вызов)"""
+    return '\n\n'.join(_extract_pdf_pages(content, 0, None))
+
+
+async def _extract_pdf_text_parallel(content: bytes, page_count: int) -> str:
+    """
+    Разобрать большой PDF параллельно в пуле процессов: по одному непрерывному
+    диапазону страниц на воркер, чтобы документ передавался и открывался
+    каждым процессом один раз, а не на каждые несколько страниц
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pdf_pool()
+    pages_per_task = -(-page_count // PDF_POOL_WORKERS)  # деление с округлением вверх
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, _extract_pdf_pages, content, start, start + pages_per_task)
+        for start in range(0, page_count, pages_per_task)
+    ))
+    return '\n\n'.join(part for chunk in chunks for part in chunk)
+
 
-        # Если текст извлёкся - возвращаем его
-        if extracted_text and len(extracted_text.strip()) > 50:
-            return extracted_text
+async def extract_pdf(content: bytes) -> str:
+    """
+    Извлечь текст из PDF
+    Сначала извлекает текстовый слой, если текст не извлёкся - использует OCR через Gemini
+    Разбор выполняется вне event loop: небольшие PDF в потоке,
+    большие - по диапазонам страниц в пуле процессов
+    """
+    # Даже открытие большого или повреждённого PDF не должно блокировать event loop
+    page_count = await asyncio.to_thread(_pdf_page_count, content)
+    # С одним доступным ядром пул процессов - только накладные расходы
+    if page_count > PDF_PROCESS_POOL_MIN_PAGES and PDF_POOL_WORKERS > 1:
+        extracted_text = await _extract_pdf_text_parallel(content, page_count)
+    else:
+        extracted_text = await asyncio.to_thread(extract_pdf_text, content)
 
-        # Если текст не извлёкся - это сканированный PDF, используем OCR
-        return await extract_pdf_ocr(tmp_path)
+    # Если текст извлёкся - возвращаем его
+    if extracted_text and len(extracted_text.strip()) > 50:
+        return extracted_text
 
-    finally:
-        os.unlink(tmp_path)
+    # Если текст не извлёкся - это сканированный PDF, используем OCR
+    return await extract_pdf_ocr(content)
 
 
-async def extract_pdf_ocr(pdf_path: str) -> str:
+async def extract_pdf_ocr(content: bytes) -> str:
     """
     OCR для сканированного PDF через Gemini
     Конвертирует страницы в изображения и отправляет на распознавание
@@ -216,7 +409,7 @@ async def extract_pdf_ocr(pdf_path: str) -> str:
     text_parts = []
 
     # Открываем PDF с помощью PyMuPDF
-    doc = fitz.open(pdf_path)
+    doc = fitz.open(stream=content, filetype="pdf")
 
     for page_num in range(len(doc)):
         page = doc[page_num]
@@ -239,93 +432,179 @@ async def extract_pdf_ocr(pdf_path: str) -> str:
     return '\n\n'.join(text_parts)
 
 
-async def ocr_image_gemini(image_bytes: bytes) -> str:
-    """OCR для одного изображения через Gemini"""
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-            "X-Title": "SGC Legal AI"
-        },
-        json={
-            "model": settings.model_file_processor,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Распознай и извлеки весь текст с этого изображения. Выведи только распознанный текст, сохраняя структуру и форматирование. Если текста нет, напиши 'Текст не обнаружен'."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 4096
-        },
-        timeout=120
+# Размер куска исходных данных для base64: кратен 3, поэтому куски
+# кодируются независимо и склеиваются без паддинга посередине
+B64_CHUNK_SIZE = 48 * 1024
+
+# Маркер в JSON, вместо которого подставляется base64 медиафайла
+MEDIA_PLACEHOLDER = "__SGC_MEDIA_{}__"
+MEDIA_PLACEHOLDER_RE = re.compile(rb'__SGC_MEDIA_(\d+)__')
+
+# Промпт для распознавания текста на изображении
+OCR_PROMPT = "Распознай и извлеки весь текст с этого изображения. Выведи только распознанный текст, сохраняя структуру и форматирование. Если текста нет, напиши 'Текст не обнаружен'."
+
+# Пакетное OCR: сколько изображений отправлять в одном запросе
+IMAGE_BATCH_SIZE = 8
+BATCH_OCR_PROMPT = (
+    "Распознай и извлеки весь текст с каждого из {count} изображений. "
+    "Перед текстом каждого изображения выведи на отдельной строке маркер ===N===, "
+    "где N — номер изображения по порядку, начиная с 1. "
+    "Выводи только распознанный текст, сохраняя структуру и форматирование. "
+    "Если на изображении нет текста, напиши под его маркером 'Текст не обнаружен'."
+)
+BATCH_MARKER_RE = re.compile(r'^\s*===\s*(\d+)\s*===\s*$', re.MULTILINE)
+
+
+def _iter_base64(content: bytes) -> Iterator[bytes]:
+    """Кодировать данные в base64 по кускам, не создавая полную копию"""
+    view = memoryview(content)
+    for i in range(0, len(view), B64_CHUNK_SIZE):
+        yield pybase64.b64encode(view[i:i + B64_CHUNK_SIZE])
+
+
+def _iter_json_with_media(payload: dict, media: List[bytes]) -> Iterator[bytes]:
+    """
+    Сериализовать payload в JSON потоком.
+    Маркеры MEDIA_PLACEHOLDER.format(i) заменяются на base64 от media[i]
+    """
+    parts = MEDIA_PLACEHOLDER_RE.split(orjson.dumps(payload))
+    for i, part in enumerate(parts):
+        if i % 2:
+            yield from _iter_base64(media[int(part)])
+        elif part:
+            yield part
+
+
+async def _aiter_json_with_media(payload: dict, media: List[bytes]) -> AsyncIterator[bytes]:
+    """Асинхронная обёртка над _iter_json_with_media для httpx.AsyncClient"""
+    for chunk in _iter_json_with_media(payload, media):
+        yield chunk
+
+
+async def _post_media_request(payload: dict, media: List[bytes]) -> str:
+    """Отправить multimodal запрос в OpenRouter, передавая тело по кускам"""
+    client = get_async_client()
+    response = await client.post(
+        OPENROUTER_API_URL,
+        content=_aiter_json_with_media(payload, media),
+        timeout=120.0
     )
 
     response.raise_for_status()
-    result = response.json()
+    result = orjson.loads(response.content)
     return result["choices"][0]["message"]["content"]
 
 
+async def ocr_image_gemini(image_bytes: bytes) -> str:
+    """OCR для одного изображения через Gemini"""
+    payload = {
+        "model": settings.model_file_processor,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": OCR_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/png;base64,{MEDIA_PLACEHOLDER.format(0)}"
+                        }
+                    }
+                ]
+            }
+        ],
+        "max_tokens": 4096
+    }
+
+    return await _post_media_request(payload, [image_bytes])
+
+
 async def extract_image_gemini(content: bytes, filename: str) -> str:
     """
     Извлечь текст из изображения через Gemini (OpenRouter)
     Gemini поддерживает изображения как multimodal input
     """
-    # Кодируем изображение в base64
-    image_base64 = base64.b64encode(content).decode('utf-8')
     mime_type = get_image_mime_type(filename)
 
-    # Формируем запрос к Gemini через OpenRouter
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-            "X-Title": "SGC Legal AI"
-        },
-        json={
-            "model": settings.model_file_processor,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Распознай и извлеки весь текст с этого изображения. Выведи только распознанный текст, сохраняя структуру и форматирование. Если текста нет, напиши 'Текст не обнаружен'."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{image_base64}"
-                            }
+    # Формируем запрос к Gemini через OpenRouter (base64 подставляется при отправке)
+    payload = {
+        "model": settings.model_file_processor,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": OCR_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{MEDIA_PLACEHOLDER.format(0)}"
                         }
-                    ]
-                }
-            ],
-            "max_tokens": 4096
-        },
-        timeout=120
-    )
+                    }
+                ]
+            }
+        ],
+        "max_tokens": 4096
+    }
 
-    response.raise_for_status()
-    result = response.json()
+    return await _post_media_request(payload, [content])
 
-    return result["choices"][0]["message"]["content"]
+
+def _split_batch_response(text: str, count: int) -> List[str]:
+    """Разбить ответ модели по маркерам ===N=== (нумерация с 1)"""
+    parts = BATCH_MARKER_RE.split(text)
+    blocks = {}
+    for i in range(1, len(parts) - 1, 2):
+        blocks[int(parts[i])] = parts[i + 1].strip()
+    return [blocks.get(n) for n in range(1, count + 1)]
+
+
+async def _extract_images_group(files: List[Tuple[bytes, str]]) -> List[str]:
+    """Распознать текст с группы изображений одним запросом"""
+    if len(files) == 1:
+        return [await extract_image_gemini(*files[0])]
+
+    content = [{"type": "text", "text": BATCH_OCR_PROMPT.format(count=len(files))}]
+    for i, (_, filename) in enumerate(files):
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{get_image_mime_type(filename)};base64,{MEDIA_PLACEHOLDER.format(i)}"
+            }
+        })
+
+    payload = {
+        "model": settings.model_file_processor,
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": 4096 * len(files)
+    }
+
+    response = await _post_media_request(payload, [data for data, _ in files])
+    texts = _split_batch_response(response, len(files))
+
+    # Если модель пропустила маркер — распознаём такие изображения по одному
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        retried = await asyncio.gather(*(extract_image_gemini(*files[i]) for i in missing))
+        for i, text in zip(missing, retried):
+            texts[i] = text
+
+    return texts
+
+
+async def extract_images_batch(files: List[Tuple[bytes, str]]) -> List[str]:
+    """
+    Извлечь текст из нескольких изображений, упаковывая до IMAGE_BATCH_SIZE
+    изображений в один запрос к Gemini вместо запроса на каждый файл
+    """
+    groups = [files[i:i + IMAGE_BATCH_SIZE] for i in range(0, len(files), IMAGE_BATCH_SIZE)]
+    results = await asyncio.gather(*(_extract_images_group(group) for group in groups))
+    return [text for group in results for text in group]
 
 
 async def transcribe_audio_gemini(content: bytes, filename: str) -> str:
@@ -333,52 +612,45 @@ async def transcribe_audio_gemini(content: bytes, filename: str) -> str:
     Транскрибировать аудио через Gemini (OpenRouter)
     Gemini поддерживает аудио как multimodal input
     """
-    # Кодируем аудио в base64
-    audio_base64 = base64.b64encode(content).decode('utf-8')
     mime_type = get_audio_mime_type(filename)
 
-    # Формируем запрос к Gemini через OpenRouter
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-            "X-Title": "SGC Legal AI"
-        },
-        json={
-            "model": settings.model_file_processor,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Транскрибируй это аудио на русском языке. Выведи только текст транскрипции, без комментариев."
-                        },
-                        {
-                            "type": "audio_url",
-                            "audio_url": {
-                                "url": f"data:{mime_type};base64,{audio_base64}"
-                            }
+    # Формируем запрос к Gemini через OpenRouter (base64 подставляется при отправке)
+    payload = {
+        "model": settings.model_file_processor,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Транскрибируй это аудио на русском языке. Выведи только текст транскрипции, без комментариев."
+                    },
+                    {
+                        "type": "audio_url",
+                        "audio_url": {
+                            "url": f"data:{mime_type};base64,{MEDIA_PLACEHOLDER.format(0)}"
                         }
-                    ]
-                }
-            ],
-            "max_tokens": 4096
-        },
-        timeout=120
-    )
+                    }
+                ]
+            }
+        ],
+        "max_tokens": 4096
+    }
 
-    response.raise_for_status()
-    result = response.json()
+    return await _post_media_request(payload, [content])
 
-    return result["choices"][0]["message"]["content"]
+
+_WORD_RE = re.compile(r'\S+')
+
+
+def count_words(text: str) -> int:
+    """Подсчитать слова без построения списка (эквивалент len(text.split()))"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
 
 
 def get_file_summary(text: str, file_type: str, filename: str) -> str:
     """Создать краткое описание загруженного файла"""
-    word_count = len(text.split())
+    word_count = count_words(text)
     char_count = len(text)
 
     type_names = {
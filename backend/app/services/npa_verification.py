@@ -3,19 +3,29 @@ NPA (Normative Legal Acts) verification service
 Верификация ссылок на нормативно-правовые акты через Perplexity Sonar Pro
 """
 import re
-import json
+import orjson
+import time
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
-
-from app.services.openrouter import chat_completion
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import aclosing
+from urllib.parse import quote_plus
+from dataclasses import dataclass, replace
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.services.openrouter import (
+    chat_completion_async,
+    chat_completion_stream_async,
+    get_perplexity_rate_limiter
+)
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class NpaReference:
     """Ссылка на нормативно-правовой акт"""
     act_type: str  # Тип акта: ГК, УК, КоАП, ФЗ, и т.д.
@@ -38,7 +48,7 @@ class NpaReference:
         }
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class VerifiedNpa:
     """Верифицированный НПА"""
     reference: NpaReference
@@ -48,13 +58,9 @@ class VerifiedNpa:
     verification_source: str = "perplexity"
     amendment_info: Optional[str] = None  # Информация о изменениях
     repeal_info: Optional[str] = None  # Информация об утрате силы
-    sources: List[str] = None  # Источники проверки
+    sources: Tuple[str, ...] = ()  # Источники проверки
     confidence: str = "medium"  # high, medium, low
 
-    def __post_init__(self):
-        if self.sources is None:
-            self.sources = []
-
     def to_dict(self) -> Dict[str, Any]:
         return {
             **self.reference.to_dict(),
@@ -64,28 +70,49 @@ class VerifiedNpa:
             "verification_source": self.verification_source,
             "amendment_info": self.amendment_info,
             "repeal_info": self.repeal_info,
-            "sources": self.sources,
+            "sources": list(self.sources),
             "confidence": self.confidence
         }
 
 
-# Регулярные выражения для извлечения ссылок на НПА
-NPA_PATTERNS = [
+# Регулярные выражения для извлечения ссылок на НПА (имя -> шаблон).
+# Имена групп внутри шаблона имеют префикс, чтобы не пересекаться в общем выражении
+NPA_PATTERNS = {
     # Статьи кодексов: ст. 333 ГК РФ, ст. 15 УК РФ
-    r'ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ',
+    "article": r'ст(?:атьи?|\.)\s*(?P<a_art>\d+(?:\.\d+)?)\s+(?P<a_code>[А-ЯЁ]{2,5})\s*РФ',
     # Части статей: ч. 1 ст. 333 ГК РФ
-    r'ч(?:асти?|\.)\s*(\d+)\s+ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ',
+    "part": r'ч(?:асти?|\.)\s*(?P<c_part>\d+)\s+ст(?:атьи?|\.)\s*(?P<c_art>\d+(?:\.\d+)?)\s+(?P<c_code>[А-ЯЁ]{2,5})\s*РФ',
     # Пункты статей: п. 1 ст. 333 ГК РФ
-    r'п(?:ункта?|\.)\s*(\d+)\s+ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ',
-    # Федеральные законы: ФЗ от 08.02.1998 N 14-ФЗ
-    r'(?:Федеральн(?:ого|ый)\s+закон(?:а)?|ФЗ)\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+(?:-ФЗ)?)',
-    # Постановления Правительства
-    r'[Пп]остановлени[еия]\s+Правительства\s*РФ\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+)',
-    # Указы Президента
-    r'[Уу]каз(?:а)?\s+Президента\s*РФ\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+)',
-    # Приказы министерств
-    r'[Пп]риказ(?:а)?\s+([А-ЯЁа-яё]+)\s+(?:России|РФ)\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+)',
-]
+    "paragraph": r'п(?:ункта?|\.)\s*(?P<p_par>\d+)\s+ст(?:атьи?|\.)\s*(?P<p_art>\d+(?:\.\d+)?)\s+(?P<p_code>[А-ЯЁ]{2,5})\s*РФ',
+    # Подпункты: пп. 1 п. 2 ст. 333 ГК РФ
+    "subparagraph": r'пп(?:одпункта?|\.)\s*(?P<s_sub>\d+)\s+п(?:ункта?|\.)\s*(?P<s_par>\d+)\s+ст(?:атьи?|\.)\s*(?P<s_art>\d+(?:\.\d+)?)\s+(?P<s_code>[А-ЯЁ]{2,5})\s*РФ',
+    # Федеральные законы: ФЗ от 08.02.1998 N 14-ФЗ или Федеральный закон от ...
+    "federal_law": r'(?:Федеральн(?:ого|ый)\s+закон(?:а)?|ФЗ)\s+от\s+(?P<f_date>\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(?P<f_num>\d+(?:-ФЗ)?)',
+    # Постановления Правительства РФ (с учётом регистра)
+    "government_decree": r'(?-i:[Пп]остановлени[еия]\s+Правительства\s*РФ\s+от\s+(?P<g_date>\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(?P<g_num>\d+))',
+    # Указы Президента РФ (с учётом регистра)
+    "presidential_decree": r'(?-i:[Уу]каз(?:а)?\s+Президента\s*РФ\s+от\s+(?P<u_date>\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(?P<u_num>\d+))',
+}
+
+# Все шаблоны одним выражением: один проход по тексту вместо отдельного на каждый шаблон.
+# Lookahead не поглощает текст, поэтому вложенные ссылки (ст. 333 ГК РФ внутри
+# п. 1 ст. 333 ГК РФ) находятся так же, как при раздельном поиске.
+# Первый класс символов - начальные буквы всех шаблонов: позволяет движку
+# быстро пропускать позиции, с которых ссылка начаться не может
+NPA_REGEX = re.compile(
+    "(?=[СсЧчПпФфУу])(?="
+    + "|".join(f"(?P<{name}>{pattern})" for name, pattern in NPA_PATTERNS.items())
+    + ")",
+    re.IGNORECASE
+)
+
+# JSON-объект в ответе модели (от первой до последней фигурной скобки)
+JSON_OBJECT_RE = re.compile(r'\{[\s\S]*\}')
+
+# Литералы, без которых не совпадёт ни один шаблон (в нижнем регистре):
+# ссылки на кодексы и подзаконные акты заканчиваются на "РФ", федеральные
+# законы содержат "ФЗ" или "закон". Текст без них regex не сканирует
+NPA_REQUIRED_LITERALS = ("рф", "фз", "закон")
 
 # Расшифровка аббревиатур кодексов
 CODE_NAMES = {
@@ -110,6 +137,19 @@ CODE_NAMES = {
     "КВВТ": "Кодекс внутреннего водного транспорта Российской Федерации",
 }
 
+
+class _CodeNames(dict):
+    """Названия кодексов с запоминанием запасного названия для неизвестных аббревиатур"""
+
+    def __missing__(self, code: str) -> str:
+        name = f"{code} РФ"
+        self[code] = name
+        return name
+
+
+# Отдельная копия: CODE_NAMES остаётся списком известных кодексов (generate_npa_link)
+_CODE_NAMES_LOOKUP = _CodeNames(CODE_NAMES)
+
 # Промпт для извлечения ссылок на НПА
 EXTRACTION_SYSTEM_PROMPT = """Ты — юридический эксперт, специализирующийся на анализе нормативно-правовых актов Российской Федерации.
 
@@ -124,36 +164,47 @@ EXTRACTION_SYSTEM_PROMPT = """Ты — юридический эксперт, с
 6. Постановления Пленума ВС РФ
 7. Информационные письма ВАС РФ (до 2014 г.)
 
-Для каждой найденной ссылки укажи:
-- act_type: тип акта (ГК, УК, ФЗ, ПП_РФ, УП_РФ и т.д.)
-- act_name: полное название акта
-- article: номер статьи (если применимо)
-- part: часть статьи (если указана)
-- paragraph: пункт статьи (если указан)
-- subparagraph: подпункт (если указан)
-- raw_reference: исходный текст ссылки
+Если НПА не найдено, верни пустой список npa_references."""
 
-Ответь ТОЛЬКО в формате JSON:
-{
-  "npa_references": [
-    {
-      "act_type": "ГК",
-      "act_name": "Гражданский кодекс Российской Федерации",
-      "article": "333",
-      "part": null,
-      "paragraph": "1",
-      "subparagraph": null,
-      "raw_reference": "п. 1 ст. 333 ГК РФ"
+
+class NpaReferenceItem(BaseModel):
+    """Ссылка на НПА в ответе LLM-извлечения"""
+    model_config = ConfigDict(extra="forbid")
+
+    act_type: str = Field(description="Тип акта: ГК, УК, ФЗ, ПП_РФ, УП_РФ и т.д.")
+    act_name: str = Field(description="Полное название акта")
+    article: str = Field(description="Номер статьи (пустая строка, если неприменимо)")
+    part: Optional[str] = Field(description="Часть статьи, если указана")
+    paragraph: Optional[str] = Field(description="Пункт статьи, если указан")
+    subparagraph: Optional[str] = Field(description="Подпункт, если указан")
+    raw_reference: str = Field(description="Исходный текст ссылки")
+
+
+class NpaExtraction(BaseModel):
+    """Ответ LLM-извлечения ссылок на НПА"""
+    model_config = ConfigDict(extra="forbid")
+
+    npa_references: List[NpaReferenceItem]
+
+
+# Схема ответа передаётся через response_format вместо описания формата в промпте
+EXTRACTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "npa_references",
+        "strict": True,
+        "schema": NpaExtraction.model_json_schema()
     }
-  ]
 }
 
-Если НПА не найдено, верни: {"npa_references": []}"""
-
-# Промпт для верификации НПА через Perplexity
-VERIFICATION_PROMPT_TEMPLATE = """Проверь актуальность и корректность ссылки на нормативно-правовой акт:
+# Общие для всех запросов system messages (не изменять: список сообщений
+# создаётся на каждый запрос, сами словари - по одному на модуль)
+_EXTRACTION_SYSTEM_MESSAGE = {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT}
 
-{npa_reference}
+# Промпты для верификации НПА через Perplexity. Инструкции вынесены в постоянный
+# system prompt, а проверяемые ссылки передаются отдельным user-сообщением:
+# одинаковый префикс запросов может кэшироваться на стороне провайдера
+VERIFICATION_SYSTEM_PROMPT = """Проверь актуальность и корректность ссылки на нормативно-правовой акт из сообщения пользователя.
 
 ЗАДАЧИ ВЕРИФИКАЦИИ:
 
@@ -171,7 +222,7 @@ VERIFICATION_PROMPT_TEMPLATE = """Проверь актуальность и к
 4. ИСТОЧНИКИ: Укажи источники, где ты нашёл информацию (ссылки на consultant.ru, garant.ru, pravo.gov.ru)
 
 Ответь в формате JSON:
-{{
+{
   "exists": true/false,
   "is_active": true/false,
   "status": "VERIFIED" | "AMENDED" | "REPEALED" | "NOT_FOUND",
@@ -180,7 +231,39 @@ VERIFICATION_PROMPT_TEMPLATE = """Проверь актуальность и к
   "amendment_info": "информация об изменениях или null",
   "repeal_info": "информация об утрате силы или null",
   "sources": ["список источников"]
-}}
+}
+
+ВАЖНО:
+- Ищи информацию ТОЛЬКО в официальных правовых базах
+- Если не уверен — укажи confidence: "low"
+- Если норма изменена — укажи status: "AMENDED" и опиши изменения
+- Если норма утратила силу — укажи status: "REPEALED" и дату утраты силы"""
+
+# Пакетная верификация нескольких ссылок одним запросом
+BATCH_VERIFICATION_SYSTEM_PROMPT = """Проверь актуальность и корректность пронумерованных ссылок на нормативно-правовые акты из сообщения пользователя.
+
+Для КАЖДОЙ ссылки выполни проверку:
+1. СУЩЕСТВОВАНИЕ: существует ли данная норма (КонсультантПлюс, Гарант, pravo.gov.ru)
+2. АКТУАЛЬНОСТЬ: действует ли норма в текущей редакции, были ли изменения, не утратила ли силу
+3. ТЕКСТ НОРМЫ: если норма действует — её актуальный текст (кратко, основную суть)
+4. ИСТОЧНИКИ: ссылки на consultant.ru, garant.ru, pravo.gov.ru
+
+Ответь в формате JSON, по одной записи на каждую ссылку с её номером:
+{
+  "results": [
+    {
+      "index": 1,
+      "exists": true/false,
+      "is_active": true/false,
+      "status": "VERIFIED" | "AMENDED" | "REPEALED" | "NOT_FOUND",
+      "confidence": "high" | "medium" | "low",
+      "current_text": "актуальный текст нормы или null",
+      "amendment_info": "информация об изменениях или null",
+      "repeal_info": "информация об утрате силы или null",
+      "sources": ["список источников"]
+    }
+  ]
+}
 
 ВАЖНО:
 - Ищи информацию ТОЛЬКО в официальных правовых базах
@@ -188,108 +271,89 @@ VERIFICATION_PROMPT_TEMPLATE = """Проверь актуальность и к
 - Если норма изменена — укажи status: "AMENDED" и опиши изменения
 - Если норма утратила силу — укажи status: "REPEALED" и дату утраты силы"""
 
+_VERIFICATION_SYSTEM_MESSAGE = {"role": "system", "content": VERIFICATION_SYSTEM_PROMPT}
+_BATCH_VERIFICATION_SYSTEM_MESSAGE = {"role": "system", "content": BATCH_VERIFICATION_SYSTEM_PROMPT}
+
+# Сколько ссылок проверяется одним запросом к Perplexity
+NPA_VERIFY_BATCH_SIZE = 8
+
+# Сколько пакетов проверяется одновременно; частоту запросов дополнительно
+# ограничивает RPM-лимитер Perplexity (settings.perplexity_rpm)
+NPA_VERIFY_CONCURRENCY = 20
+
 
 def extract_npa_references_regex(text: str) -> List[NpaReference]:
     """
     Извлечение ссылок на НПА с помощью регулярных выражений.
     Быстрый метод для простых случаев.
     """
-    references = []
+    # Быстрый отсев текстов без ссылок на НПА
+    lowered = text.lower()
+    if not any(literal in lowered for literal in NPA_REQUIRED_LITERALS):
+        return []
 
-    # Статьи кодексов: ст. 333 ГК РФ
-    pattern1 = r'ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ'
-    for match in re.finditer(pattern1, text, re.IGNORECASE):
-        article, code = match.groups()
-        code_upper = code.upper()
-        references.append(NpaReference(
-            act_type=code_upper,
-            act_name=CODE_NAMES.get(code_upper, f"{code_upper} РФ"),
-            article=article,
-            raw_reference=match.group(0)
-        ))
+    # Ссылки без дубликатов (по raw_reference) в порядке первого появления
+    references: Dict[str, NpaReference] = {}
+
+    for match in NPA_REGEX.finditer(text):
+        kind = match.lastgroup
+        raw_reference = match.group(kind)
+        if raw_reference in references:
+            continue
+
+        if kind == "federal_law":
+            date, number = match.group("f_date", "f_num")
+            references[raw_reference] = NpaReference(
+                act_type="ФЗ",
+                act_name=f"Федеральный закон от {date} № {number}",
+                article="",
+                raw_reference=raw_reference
+            )
+            continue
+
+        if kind == "government_decree":
+            date, number = match.group("g_date", "g_num")
+            references[raw_reference] = NpaReference(
+                act_type="ПП_РФ",
+                act_name=f"Постановление Правительства РФ от {date} № {number}",
+                article="",
+                raw_reference=raw_reference
+            )
+            continue
+
+        if kind == "presidential_decree":
+            date, number = match.group("u_date", "u_num")
+            references[raw_reference] = NpaReference(
+                act_type="УП_РФ",
+                act_name=f"Указ Президента РФ от {date} № {number}",
+                article="",
+                raw_reference=raw_reference
+            )
+            continue
+
+        # Ссылки на статьи кодексов: ст., ч. ст., п. ст., пп. п. ст.
+        part = paragraph = subparagraph = None
+        if kind == "article":
+            article, code = match.group("a_art", "a_code")
+        elif kind == "part":
+            part, article, code = match.group("c_part", "c_art", "c_code")
+        elif kind == "paragraph":
+            paragraph, article, code = match.group("p_par", "p_art", "p_code")
+        else:
+            subparagraph, paragraph, article, code = match.group("s_sub", "s_par", "s_art", "s_code")
 
-    # Части статей: ч. 1 ст. 333 ГК РФ
-    pattern2 = r'ч(?:асти?|\.)\s*(\d+)\s+ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ'
-    for match in re.finditer(pattern2, text, re.IGNORECASE):
-        part, article, code = match.groups()
         code_upper = code.upper()
-        references.append(NpaReference(
+        references[raw_reference] = NpaReference(
             act_type=code_upper,
-            act_name=CODE_NAMES.get(code_upper, f"{code_upper} РФ"),
+            act_name=_CODE_NAMES_LOOKUP[code_upper],
             article=article,
             part=part,
-            raw_reference=match.group(0)
-        ))
-
-    # Пункты статей: п. 1 ст. 333 ГК РФ
-    pattern3 = r'п(?:ункта?|\.)\s*(\d+)\s+ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ'
-    for match in re.finditer(pattern3, text, re.IGNORECASE):
-        paragraph, article, code = match.groups()
-        code_upper = code.upper()
-        references.append(NpaReference(
-            act_type=code_upper,
-            act_name=CODE_NAMES.get(code_upper, f"{code_upper} РФ"),
-            article=article,
-            paragraph=paragraph,
-            raw_reference=match.group(0)
-        ))
-
-    # Подпункты: пп. 1 п. 2 ст. 333 ГК РФ
-    pattern4 = r'пп(?:одпункта?|\.)\s*(\d+)\s+п(?:ункта?|\.)\s*(\d+)\s+ст(?:атьи?|\.)\s*(\d+(?:\.\d+)?)\s+([А-ЯЁ]{2,5})\s*РФ'
-    for match in re.finditer(pattern4, text, re.IGNORECASE):
-        subparagraph, paragraph, article, code = match.groups()
-        code_upper = code.upper()
-        references.append(NpaReference(
-            act_type=code_upper,
-            act_name=CODE_NAMES.get(code_upper, f"{code_upper} РФ"),
-            article=article,
             paragraph=paragraph,
             subparagraph=subparagraph,
-            raw_reference=match.group(0)
-        ))
-
-    # Федеральные законы: ФЗ от 08.02.1998 N 14-ФЗ или Федеральный закон от ...
-    pattern5 = r'(?:Федеральн(?:ого|ый)\s+закон(?:а)?|ФЗ)\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+(?:-ФЗ)?)'
-    for match in re.finditer(pattern5, text, re.IGNORECASE):
-        date, number = match.groups()
-        references.append(NpaReference(
-            act_type="ФЗ",
-            act_name=f"Федеральный закон от {date} № {number}",
-            article="",
-            raw_reference=match.group(0)
-        ))
-
-    # Постановления Правительства РФ
-    pattern6 = r'[Пп]остановлени[еия]\s+Правительства\s*РФ\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+)'
-    for match in re.finditer(pattern6, text):
-        date, number = match.groups()
-        references.append(NpaReference(
-            act_type="ПП_РФ",
-            act_name=f"Постановление Правительства РФ от {date} № {number}",
-            article="",
-            raw_reference=match.group(0)
-        ))
-
-    # Указы Президента РФ
-    pattern7 = r'[Уу]каз(?:а)?\s+Президента\s*РФ\s+от\s+(\d{2}\.\d{2}\.\d{4})\s*[NН№]\s*(\d+)'
-    for match in re.finditer(pattern7, text):
-        date, number = match.groups()
-        references.append(NpaReference(
-            act_type="УП_РФ",
-            act_name=f"Указ Президента РФ от {date} № {number}",
-            article="",
-            raw_reference=match.group(0)
-        ))
-
-    # Удаляем дубликаты (по raw_reference)
-    seen = set()
-    unique_refs = []
-    for ref in references:
-        if ref.raw_reference not in seen:
-            seen.add(ref.raw_reference)
-            unique_refs.append(ref)
+            raw_reference=raw_reference
+        )
 
-    return unique_refs
+    return list(references.values())
 
 
 async def extract_npa_references_llm(text: str) -> List[NpaReference]:
@@ -297,32 +361,35 @@ async def extract_npa_references_llm(text: str) -> List[NpaReference]:
     Извлечение ссылок на НПА с помощью LLM.
     Более точный метод для сложных случаев.
     """
+    # Инструкция - постоянный system prompt, в user только текст (ограничиваем размер)
     extraction_prompt = f"""Проанализируй текст и извлеки ВСЕ ссылки на нормативно-правовые акты:
 
 ТЕКСТ:
-{text[:8000]}  # Ограничиваем размер текста
-
-{EXTRACTION_SYSTEM_PROMPT}"""
+{text[:8000]}"""
 
-    messages = [{"role": "user", "content": extraction_prompt}]
+    messages = [
+        _EXTRACTION_SYSTEM_MESSAGE,
+        {"role": "user", "content": extraction_prompt}
+    ]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(
-                settings.model_fast,  # Используем быструю модель для извлечения
-                messages,
-                stream=False,
-                max_tokens=2048
-            )
+        response = await chat_completion_async(
+            settings.model_fast,  # Используем быструю модель для извлечения
+            messages,
+            stream=False,
+            max_tokens=2048,
+            response_format=EXTRACTION_RESPONSE_FORMAT
         )
         content = response["choices"][0]["message"]["content"]
 
-        # Парсим JSON из ответа
-        json_match = re.search(r'\{[\s\S]*\}', content)
-        if json_match:
-            data = json.loads(json_match.group())
+        # Structured output - JSON целиком; если провайдер проигнорировал схему,
+        # ищем объект в тексте
+        try:
+            data = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            json_match = JSON_OBJECT_RE.search(content)
+            data = orjson.loads(json_match.group()) if json_match else None
+        if data:
             references = []
             for ref_data in data.get("npa_references", []):
                 references.append(NpaReference(
@@ -341,57 +408,82 @@ async def extract_npa_references_llm(text: str) -> List[NpaReference]:
     return []
 
 
-async def verify_npa_reference(reference: NpaReference) -> VerifiedNpa:
-    """
-    Верификация одной ссылки на НПА через Perplexity.
-    """
-    # Формируем описание ссылки для верификации
-    ref_description = f"{reference.raw_reference}"
+# Кэш результатов верификации: одна и та же норма из разных документов
+# не проверяется через Perplexity повторно
+VERIFY_CACHE_TTL = 24 * 3600  # секунд
+VERIFY_CACHE_MAX_SIZE = 4096
+
+_verify_cache: "OrderedDict[tuple, tuple[float, VerifiedNpa]]" = OrderedDict()
+_verify_cache_lock = threading.Lock()
+
+
+def _verify_cache_key(reference: NpaReference) -> tuple:
+    """Ключ кэша: акт и структурная единица нормы (без исходного текста ссылки)"""
+    return (
+        reference.act_type,
+        reference.act_name,
+        reference.article,
+        reference.part,
+        reference.paragraph,
+        reference.subparagraph,
+    )
+
+
+def _verify_cache_get(key: tuple) -> Optional[VerifiedNpa]:
+    """Вернуть результат верификации из кэша, если он ещё не устарел"""
+    with _verify_cache_lock:
+        entry = _verify_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > VERIFY_CACHE_TTL:
+            del _verify_cache[key]
+            return None
+        _verify_cache.move_to_end(key)
+        return result
+
+
+def _verify_cache_put(key: tuple, result: VerifiedNpa):
+    """Сохранить результат верификации в кэш, вытесняя самые старые записи"""
+    with _verify_cache_lock:
+        _verify_cache[key] = (time.monotonic(), result)
+        _verify_cache.move_to_end(key)
+        while len(_verify_cache) > VERIFY_CACHE_MAX_SIZE:
+            _verify_cache.popitem(last=False)
+
+
+def _describe_reference(reference: NpaReference) -> str:
+    """Описание ссылки для промпта верификации"""
+    head = reference.raw_reference
     if reference.act_name:
-        ref_description += f" ({reference.act_name})"
+        head = f"{head} ({reference.act_name})"
+    parts = [head]
     if reference.article:
-        ref_description += f", статья {reference.article}"
+        parts.append(f"статья {reference.article}")
     if reference.part:
-        ref_description += f", часть {reference.part}"
+        parts.append(f"часть {reference.part}")
     if reference.paragraph:
-        ref_description += f", пункт {reference.paragraph}"
+        parts.append(f"пункт {reference.paragraph}")
+    return ", ".join(parts)
 
-    verification_prompt = VERIFICATION_PROMPT_TEMPLATE.format(npa_reference=ref_description)
-    messages = [{"role": "user", "content": verification_prompt}]
 
-    try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: chat_completion(
-                "perplexity/sonar-pro-search",  # Используем Perplexity для поиска
-                messages,
-                stream=False,
-                max_tokens=2048
-            )
-        )
-        content = response["choices"][0]["message"]["content"]
+def _verified_from_data(reference: NpaReference, data: Dict[str, Any]) -> VerifiedNpa:
+    """Собрать VerifiedNpa из JSON-ответа модели"""
+    return VerifiedNpa(
+        reference=reference,
+        status=data.get("status", "NOT_FOUND"),
+        is_active=data.get("is_active", False),
+        current_text=data.get("current_text"),
+        verification_source="perplexity",
+        amendment_info=data.get("amendment_info"),
+        repeal_info=data.get("repeal_info"),
+        sources=tuple(data.get("sources") or ()),
+        confidence=data.get("confidence", "low")
+    )
 
-        # Парсим JSON из ответа
-        json_match = re.search(r'\{[\s\S]*?\}', content, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-
-            return VerifiedNpa(
-                reference=reference,
-                status=data.get("status", "NOT_FOUND"),
-                is_active=data.get("is_active", False),
-                current_text=data.get("current_text"),
-                verification_source="perplexity",
-                amendment_info=data.get("amendment_info"),
-                repeal_info=data.get("repeal_info"),
-                sources=data.get("sources", []),
-                confidence=data.get("confidence", "low")
-            )
-    except Exception as e:
-        logger.error(f"Error verifying NPA reference: {e}")
 
-    # Возвращаем NOT_FOUND при ошибке
+def _not_found(reference: NpaReference) -> VerifiedNpa:
+    """Результат для ссылки, которую не удалось проверить"""
     return VerifiedNpa(
         reference=reference,
         status="NOT_FOUND",
@@ -401,36 +493,217 @@ async def verify_npa_reference(reference: NpaReference) -> VerifiedNpa:
     )
 
 
-async def verify_npa_references(references: List[NpaReference], max_concurrent: int = 3) -> List[VerifiedNpa]:
+class _JsonObjectScanner:
+    """
+    Поиск первого JSON-объекта верхнего уровня в потоке текста.
+    Текст до первой '{' пропускается, скобки внутри строк не учитываются.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> Optional[str]:
+        """Добавить фрагмент; вернуть объект целиком, как только он закрылся"""
+        start = 0
+        if self._depth == 0:
+            start = text.find("{")
+            if start == -1:
+                return None
+
+        for i in range(start, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:i + 1])
+                    return "".join(self._parts)
+
+        self._parts.append(text[start:])
+        return None
+
+
+async def _stream_json_object(model: str, messages: list, max_tokens: int) -> Optional[str]:
+    """
+    Стриминговый запрос, который обрывается сразу после закрытия первого
+    JSON-объекта в ответе: хвост генерации не ждём и не оплачиваем.
+    Как и chat_completion_async, учитывается RPM-лимитером Perplexity; поток короткий,
+    поэтому занимает слот общего семафора запросов (hold_slot - только пока поток
+    открыт, не во время ожидания лимитера модели и пауз между повторами).
+    """
+    scanner = _JsonObjectScanner()
+    await get_perplexity_rate_limiter().acquire()
+    stream = chat_completion_stream_async(model, messages, max_tokens=max_tokens, hold_slot=True)
+    async with aclosing(stream):
+        async for chunk in stream:
+            choices = orjson.loads(chunk).get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                json_text = scanner.feed(delta)
+                if json_text is not None:
+                    return json_text
+    return None
+
+
+async def verify_npa_reference(reference: NpaReference) -> VerifiedNpa:
+    """
+    Верификация одной ссылки на НПА через Perplexity.
+    Успешные результаты кэшируются на VERIFY_CACHE_TTL.
+    """
+    cache_key = _verify_cache_key(reference)
+    cached = _verify_cache_get(cache_key)
+    if cached is not None:
+        # Та же норма, но ссылка в тексте может быть записана иначе
+        return replace(cached, reference=reference)
+
+    messages = [
+        _VERIFICATION_SYSTEM_MESSAGE,
+        {"role": "user", "content": _describe_reference(reference)}
+    ]
+
+    try:
+        # Ответ читаем потоком до закрытия JSON-объекта
+        json_text = await _stream_json_object(
+            "perplexity/sonar-pro-search",  # Используем Perplexity для поиска
+            messages,
+            max_tokens=2048
+        )
+        if json_text:
+            data = orjson.loads(json_text)
+
+            result = _verified_from_data(reference, data)
+            _verify_cache_put(cache_key, result)
+            return result
+    except Exception as e:
+        logger.error(f"Error verifying NPA reference: {e}")
+
+    # Возвращаем NOT_FOUND при ошибке
+    return _not_found(reference)
+
+
+async def verify_npa_references_batch(references: List[NpaReference]) -> List[VerifiedNpa]:
+    """
+    Верификация нескольких ссылок на НПА одним запросом к Perplexity.
+    Ссылки, для которых не удалось разобрать ответ, проверяются по одной.
+    """
+    if not references:
+        return []
+    if len(references) == 1:
+        return [await verify_npa_reference(references[0])]
+
+    npa_references = "\n".join(
+        f"{i}. {_describe_reference(ref)}" for i, ref in enumerate(references, 1)
+    )
+    messages = [
+        _BATCH_VERIFICATION_SYSTEM_MESSAGE,
+        {"role": "user", "content": npa_references}
+    ]
+
+    results: List[Optional[VerifiedNpa]] = [None] * len(references)
+    try:
+        await get_perplexity_rate_limiter().acquire()
+        response = await chat_completion_async(
+            "perplexity/sonar-pro-search",  # Используем Perplexity для поиска
+            messages,
+            stream=False,
+            max_tokens=1024 * len(references)
+        )
+        content = response["choices"][0]["message"]["content"]
+
+        # Парсим JSON из ответа
+        json_match = JSON_OBJECT_RE.search(content)
+        if json_match:
+            records = orjson.loads(json_match.group()).get("results", [])
+            for position, data in enumerate(records):
+                if not isinstance(data, dict):
+                    continue
+                # Номер ссылки из ответа, иначе - порядок записи
+                index = data.get("index")
+                i = index - 1 if isinstance(index, int) else position
+                if 0 <= i < len(references) and results[i] is None:
+                    results[i] = _verified_from_data(references[i], data)
+                    _verify_cache_put(_verify_cache_key(references[i]), results[i])
+    except Exception as e:
+        logger.error(f"Error verifying NPA references batch: {e}")
+
+    # Fallback: ссылки без записи в пакетном ответе проверяем по одной
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        fallback = await asyncio.gather(
+            *(verify_npa_reference(references[i]) for i in missing)
+        )
+        for i, result in zip(missing, fallback):
+            results[i] = result
+
+    return results
+
+
+async def verify_npa_references(
+    references: List[NpaReference],
+    max_concurrent: int = NPA_VERIFY_CONCURRENCY,
+    batch_size: int = NPA_VERIFY_BATCH_SIZE
+) -> List[VerifiedNpa]:
     """
     Параллельная верификация списка ссылок на НПА.
+    Одинаковые нормы проверяются один раз, остальные - пакетами по batch_size.
     """
     if not references:
         return []
 
-    # Ограничиваем количество параллельных запросов
+    # Уникальные нормы, которых нет в кэше (порядок первого появления)
+    pending: Dict[tuple, NpaReference] = {}
+    for ref in references:
+        key = _verify_cache_key(ref)
+        if key not in pending and _verify_cache_get(key) is None:
+            pending[key] = ref
+
+    # Ограничиваем количество параллельных пакетов; частоту запросов к Perplexity
+    # ограничивает RPM-лимитер в каждом фактическом запросе (включая fallback по одной)
     semaphore = asyncio.Semaphore(max_concurrent)
 
-    async def verify_with_semaphore(ref: NpaReference) -> VerifiedNpa:
+    async def verify_with_semaphore(batch: List[NpaReference]) -> List[VerifiedNpa]:
         async with semaphore:
-            return await verify_npa_reference(ref)
+            return await verify_npa_references_batch(batch)
 
-    tasks = [verify_with_semaphore(ref) for ref in references]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    unique = list(pending.values())
+    batches = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+    results = await asyncio.gather(
+        *(verify_with_semaphore(batch) for batch in batches),
+        return_exceptions=True
+    )
 
-    verified = []
-    for ref, result in zip(references, results):
+    checked: Dict[tuple, VerifiedNpa] = {}
+    for batch, result in zip(batches, results):
         if isinstance(result, Exception):
-            logger.error(f"Error verifying {ref.raw_reference}: {result}")
-            verified.append(VerifiedNpa(
-                reference=ref,
-                status="NOT_FOUND",
-                is_active=False,
-                verification_source="perplexity",
-                confidence="low"
-            ))
-        else:
+            logger.error(f"Error verifying NPA batch: {result}")
+            continue
+        for ref, verified in zip(batch, result):
+            checked[_verify_cache_key(ref)] = verified
+
+    verified = []
+    for ref in references:
+        key = _verify_cache_key(ref)
+        result = checked.get(key) or _verify_cache_get(key)
+        if result is None:
+            verified.append(_not_found(ref))
+        elif result.reference is ref:
             verified.append(result)
+        else:
+            # Та же норма, но ссылка в тексте может быть записана иначе
+            verified.append(replace(result, reference=ref))
 
     return verified
 
@@ -441,24 +714,46 @@ async def extract_and_verify_npa(text: str, use_llm: bool = False) -> List[Verif
 
     Args:
         text: Текст для анализа
-        use_llm: Использовать LLM для извлечения (медленнее, но точнее)
+        use_llm: Дополнительно извлекать ссылки через LLM (медленнее, но точнее)
 
     Returns:
         Список верифицированных НПА
     """
-    # Извлекаем ссылки
-    if use_llm:
-        references = await extract_npa_references_llm(text)
-    else:
-        references = extract_npa_references_regex(text)
-
-    if not references:
-        return []
-
-    # Верифицируем
-    verified = await verify_npa_references(references)
-
-    return verified
+    # Regex-ссылки известны сразу: их верификация идёт параллельно с LLM-извлечением
+    regex_refs = extract_npa_references_regex(text)
+    llm_task = asyncio.create_task(extract_npa_references_llm(text)) if use_llm else None
+    regex_task = asyncio.create_task(verify_npa_references(regex_refs))
+
+    llm_verified = []
+    if llm_task:
+        # Проверяем только нормы, которых не нашёл regex
+        seen = {_verify_cache_key(ref) for ref in regex_refs}
+        llm_refs = []
+        for ref in await llm_task:
+            key = _verify_cache_key(ref)
+            if key not in seen:
+                seen.add(key)
+                llm_refs.append(ref)
+        llm_verified = await verify_npa_references(llm_refs)
+
+    return await regex_task + llm_verified
+
+
+# Коды кодексов в адресах КонсультантПлюс
+_CODE_SLUG = {
+    "ГК": "gk",
+    "УК": "uk",
+    "ТК": "tk",
+    "НК": "nk",
+    "КоАП": "koap",
+    "АПК": "apk",
+    "ГПК": "gpk",
+    "УПК": "upk",
+    "КАС": "kas",
+    "СК": "sk",
+    "ЖК": "zhk",
+    "ЗК": "zk",
+}
 
 
 def generate_npa_link(npa: VerifiedNpa) -> Optional[Dict[str, str]]:
@@ -469,20 +764,7 @@ def generate_npa_link(npa: VerifiedNpa) -> Optional[Dict[str, str]]:
 
     # Для кодексов
     if ref.act_type in CODE_NAMES:
-        code_slug = {
-            "ГК": "gk",
-            "УК": "uk",
-            "ТК": "tk",
-            "НК": "nk",
-            "КоАП": "koap",
-            "АПК": "apk",
-            "ГПК": "gpk",
-            "УПК": "upk",
-            "КАС": "kas",
-            "СК": "sk",
-            "ЖК": "zhk",
-            "ЗК": "zk",
-        }.get(ref.act_type)
+        code_slug = _CODE_SLUG.get(ref.act_type)
 
         if code_slug and ref.article:
             return {
@@ -493,7 +775,7 @@ def generate_npa_link(npa: VerifiedNpa) -> Optional[Dict[str, str]]:
 
     # Для федеральных законов
     if ref.act_type == "ФЗ":
-        search_query = ref.act_name.replace(" ", "+")
+        search_query = quote_plus(ref.act_name)
         return {
             "url": f"https://www.consultant.ru/search/?q={search_query}",
             "label": "КонсультантПлюс",
@@ -502,7 +784,7 @@ def generate_npa_link(npa: VerifiedNpa) -> Optional[Dict[str, str]]:
 
     # Для постановлений Правительства и указов Президента
     if ref.act_type in ["ПП_РФ", "УП_РФ"]:
-        search_query = ref.act_name.replace(" ", "+")
+        search_query = quote_plus(ref.act_name)
         return {
             "url": f"http://pravo.gov.ru/proxy/ips/?searchres=&bpas=cd00000&a3type=1&a3value={search_query}",
             "label": "pravo.gov.ru",
@@ -511,7 +793,7 @@ def generate_npa_link(npa: VerifiedNpa) -> Optional[Dict[str, str]]:
 
     # Общий поиск в Google по юридическим базам
     return {
-        "url": f"https://www.google.com/search?q={ref.raw_reference.replace(' ', '+')}+site:consultant.ru+OR+site:garant.ru",
+        "url": f"https://www.google.com/search?q={quote_plus(ref.raw_reference)}+site:consultant.ru+OR+site:garant.ru",
         "label": "Найти",
         "color": "gray"
     }
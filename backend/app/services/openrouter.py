@@ -2,71 +2,268 @@
 OpenRouter API client for SGC Legal AI
 """
 import requests
+import httpx
+import orjson
 import time
+import random
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Generator
+import threading
+from collections import deque
+from contextlib import nullcontext
+from types import MappingProxyType
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Generator, AsyncGenerator, Iterable, AsyncIterable
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-def get_available_models():
-    """Return list of available models"""
-    return [
-        {
-            "id": "anthropic/claude-opus-4.5",
-            "name": "Claude Opus 4.5",
-            "description": "Флагманская модель Anthropic с расширенными возможностями",
-            "price_per_1k": 0.015
-        },
-        {
-            "id": "openai/gpt-5.2",
-            "name": "ChatGPT 5.2",
-            "description": "Новейшая флагманская модель OpenAI",
-            "price_per_1k": 0.01
-        },
-        {
-            "id": "google/gemini-3-pro-preview",
-            "name": "Gemini 3.0 Pro Preview",
-            "description": "Превью флагманской модели Google",
-            "price_per_1k": 0.008
-        },
-        {
-            "id": "google/gemini-3-flash-preview",
-            "name": "Gemini 3.0 Flash Preview",
-            "description": "Быстрая модель Google для OCR и транскрибации",
-            "price_per_1k": 0.002
-        },
-        {
-            "id": "perplexity/sonar-pro-search",
-            "name": "Perplexity Sonar Pro",
-            "description": "Модель с поиском в интернете",
-            "price_per_1k": 0.003
-        }
-    ]
+# Connection pool limits for the shared client: sized for bursts of parallel
+# uploads and consilium stages rather than httpx defaults
+HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0)
 
+# Retry policy: statuses worth retrying, full-jitter exponential backoff
+# (base * 2^attempt, capped) unless the server sends Retry-After, and a cap
+# on total time spent sleeping between attempts of one request.
+# 500 is often a non-transient upstream error: retried once, and never when
+# the body says the request itself is bad
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+SERVER_ERROR_MAX_RETRIES = 1
+UNRECOVERABLE_ERROR_MARKERS = (b"invalid_request", b"context_length_exceeded", b"maximum context length")
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_SLEEP_BUDGET = 20.0
 
-def chat_completion(
-    model: str,
-    messages: list,
-    stream: bool = False,
-    max_tokens: int = 4096,
-    reasoning_effort: str = None,
-    max_retries: int = 3
-) -> dict:
+# Headers sent with every OpenRouter request: built once at import and set
+# once on the shared clients; read-only so no caller can mutate them
+BASE_HEADERS = MappingProxyType({
+    "Authorization": f"Bearer {settings.openrouter_api_key}",
+    "Content-Type": "application/json",
+    "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
+    "X-Title": "SGC Legal AI"
+})
+
+# Connection pool size of the shared sync session (worker threads calling
+# chat_completion / search concurrently)
+SYNC_POOL_SIZE = 32
+
+# Read size for sync SSE streams (OpenRouter uses chunked transfer encoding,
+# so each network chunk is delivered as soon as it arrives)
+STREAM_CHUNK_SIZE = 8192
+
+# Shared sync requests session (keep-alive connection pool)
+_sync_session: Optional[requests.Session] = None
+_sync_session_lock = threading.Lock()
+
+# Shared async HTTP client (keep-alive + HTTP/2 multiplexing)
+_async_client: Optional[httpx.AsyncClient] = None
+_request_semaphore: Optional[asyncio.Semaphore] = None
+_perplexity_limiter: Optional["RateLimiter"] = None
+
+# Per-model RPM limiters shared by all async completions (settings.openrouter_model_rpm)
+_model_limiters: "dict[str, RateLimiter]" = {}
+
+# In-flight async completions by payload hash: identical concurrent requests
+# share one API call (singleflight)
+_completion_inflight: "dict[str, asyncio.Future]" = {}
+
+
+def _finish_inflight(key: str, task: asyncio.Future):
     """
-    Send chat completion request to OpenRouter with retry logic
+    Done-callback of a coalesced completion: retrieve the exception (all waiters
+    may have been cancelled, leaving it unobserved) and drop the in-flight entry
+    """
+    if not task.cancelled():
+        task.exception()
+    _completion_inflight.pop(key, None)
 
-    Args:
-        model: Model ID (e.g., "openai/gpt-5.2", "anthropic/claude-opus-4.5")
-        messages: List of messages
-        stream: Enable streaming
-        max_tokens: Maximum tokens in response
-        reasoning_effort: Reasoning effort level ("high", "medium", "low", "xhigh")
-                         - For GPT-5.2: enables adaptive reasoning
-                         - For Claude Opus 4.5: enables extended thinking
-        max_retries: Maximum number of retry attempts (default 3)
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Delay before retrying after 0-based `attempt`: Retry-After if parseable, else full jitter"""
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0.0), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _should_retry(status_code: int, content: bytes, attempt: int) -> bool:
+    """Whether a failed response is worth another attempt (see RETRY_STATUS_CODES)"""
+    if status_code in RETRY_STATUS_CODES:
+        return True
+    if status_code == 500 and attempt < SERVER_ERROR_MAX_RETRIES:
+        body = content.lower()
+        return not any(marker in body for marker in UNRECOVERABLE_ERROR_MARKERS)
+    return False
+
+
+def get_sync_session() -> requests.Session:
+    """
+    Get or create shared requests session for OpenRouter.
+    Keeps TCP+TLS connections alive between sync calls made from worker threads.
+    """
+    global _sync_session
+    if _sync_session is None:
+        with _sync_session_lock:
+            if _sync_session is None:
+                session = requests.Session()
+                session.headers.update(BASE_HEADERS)
+                # Retry(total=0): retries are handled by callers
+                adapter = HTTPAdapter(
+                    pool_connections=SYNC_POOL_SIZE,
+                    pool_maxsize=SYNC_POOL_SIZE,
+                    max_retries=Retry(total=0)
+                )
+                session.mount("https://", adapter)
+                _sync_session = session
+    return _sync_session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get or create shared async httpx client for OpenRouter"""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            headers=BASE_HEADERS,
+            # retries applies to connection failures only, HTTP errors are handled by callers
+            transport=httpx.AsyncHTTPTransport(http2=True, limits=HTTP_LIMITS, retries=2),
+            timeout=120.0
+        )
+    return _async_client
+
+
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Global limit on in-flight async OpenRouter requests, so that large
+    asyncio.gather fan-outs queue locally instead of tripping 429s
     """
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(settings.openrouter_max_concurrency)
+    return _request_semaphore
+
+
+class RateLimiter:
+    """
+    Sliding-window requests-per-minute limiter.
+    acquire() waits until a request fits into the last `period` seconds;
+    waiters are served in order because the lock is held while sleeping.
+    pause() holds back every waiter, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, rpm: int, period: float = 60.0):
+        self.rpm = rpm
+        self.period = period
+        self._timestamps: deque = deque()
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Stop handing out slots for `seconds` (extends an active pause, never shortens it)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                while self._timestamps and now - self._timestamps[0] >= self.period:
+                    self._timestamps.popleft()
+                if len(self._timestamps) < self.rpm:
+                    self._timestamps.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._timestamps[0]))
+
+
+def get_perplexity_rate_limiter() -> RateLimiter:
+    """Shared RPM limiter for Perplexity requests (settings.perplexity_rpm)"""
+    global _perplexity_limiter
+    if _perplexity_limiter is None:
+        _perplexity_limiter = RateLimiter(settings.perplexity_rpm)
+    return _perplexity_limiter
+
+
+def get_model_rate_limiter(model: str) -> RateLimiter:
+    """Shared RPM limiter for one upstream model (settings.openrouter_model_rpm)"""
+    limiter = _model_limiters.get(model)
+    if limiter is None:
+        limiter = _model_limiters[model] = RateLimiter(settings.openrouter_model_rpm)
+    return limiter
+
+
+async def close_async_client():
+    """Close shared async client (called on app shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+# Models shown in the UI model picker
+_MODELS = [
+    {
+        "id": "anthropic/claude-opus-4.5",
+        "name": "Claude Opus 4.5",
+        "description": "Флагманская модель Anthropic с расширенными возможностями",
+        "price_per_1k": 0.015
+    },
+    {
+        "id": "openai/gpt-5.2",
+        "name": "ChatGPT 5.2",
+        "description": "Новейшая флагманская модель OpenAI",
+        "price_per_1k": 0.01
+    },
+    {
+        "id": "google/gemini-3-pro-preview",
+        "name": "Gemini 3.0 Pro Preview",
+        "description": "Превью флагманской модели Google",
+        "price_per_1k": 0.008
+    },
+    {
+        "id": "google/gemini-3-flash-preview",
+        "name": "Gemini 3.0 Flash Preview",
+        "description": "Быстрая модель Google для OCR и транскрибации",
+        "price_per_1k": 0.002
+    },
+    {
+        "id": "perplexity/sonar-pro-search",
+        "name": "Perplexity Sonar Pro",
+        "description": "Модель с поиском в интернете",
+        "price_per_1k": 0.003
+    }
+]
+
+
+def get_available_models() -> list[dict]:
+    """Return list of available models (shared list, copy before mutating)"""
+    return _MODELS
+
+
+def _build_payload(
+    model: str,
+    messages: list,
+    stream: bool,
+    max_tokens: int,
+    reasoning_effort: Optional[str],
+    response_format: Optional[dict] = None,
+    temperature: Optional[float] = None,
+    stop: Optional[list] = None
+) -> dict:
+    """Build chat completion payload with model-specific reasoning parameters"""
     payload = {
         "model": model,
         "messages": messages,
@@ -74,6 +271,16 @@ def chat_completion(
         "stream": stream
     }
 
+    # Structured output (e.g. {"type": "json_schema", ...}) for models that support it
+    if response_format:
+        payload["response_format"] = response_format
+
+    # Optional sampling controls (omitted to keep provider defaults)
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if stop:
+        payload["stop"] = stop
+
     # Add reasoning/thinking parameters for supported models
     if reasoning_effort:
         if "gpt-5" in model:
@@ -95,103 +302,348 @@ def chat_completion(
             budget = thinking_budgets.get(reasoning_effort, 10000)
             payload["thinking"] = {"type": "enabled", "budget_tokens": budget}
 
-    headers = {
-        "Authorization": f"Bearer {settings.openrouter_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-        "X-Title": "SGC Legal AI"
-    }
+    return payload
+
+
+def chat_completion(
+    model: str,
+    messages: list,
+    stream: bool = False,
+    max_tokens: int = 4096,
+    reasoning_effort: str = None,
+    max_retries: int = 3
+) -> dict:
+    """
+    Send chat completion request to OpenRouter with retry logic
+
+    Args:
+        model: Model ID (e.g., "openai/gpt-5.2", "anthropic/claude-opus-4.5")
+        messages: List of messages
+        stream: Enable streaming
+        max_tokens: Maximum tokens in response
+        reasoning_effort: Reasoning effort level ("high", "medium", "low", "xhigh")
+                         - For GPT-5.2: enables adaptive reasoning
+                         - For Claude Opus 4.5: enables extended thinking
+        max_retries: Maximum number of retry attempts (default 3)
+    """
+    payload = _build_payload(model, messages, stream, max_tokens, reasoning_effort)
 
     # Log payload for debugging (без messages для краткости)
     debug_payload = {k: v for k, v in payload.items() if k != "messages"}
     logger.info(f"OpenRouter request: {model} | params: {debug_payload}")
 
     last_error = None
+    slept = 0.0
     for attempt in range(max_retries):
+        retry_after = None
         try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
+            response = get_sync_session().post(
+                OPENROUTER_API_URL,
+                data=orjson.dumps(payload),
                 timeout=300  # Increased timeout for thinking models
             )
 
-            # Check for rate limiting or server errors (retry these)
-            if response.status_code in [429, 500, 502, 503, 504]:
-                wait_time = (2 ** attempt) * 2  # 2s, 4s, 8s
-                logger.warning(f"OpenRouter {response.status_code} for {model}, retry {attempt+1}/{max_retries} in {wait_time}s")
-                time.sleep(wait_time)
-                continue
-
-            response.raise_for_status()
-            return response.json()
+            # Check for rate limiting or transient server errors (retry these)
+            if response.status_code >= 400 and _should_retry(response.status_code, response.content, attempt):
+                last_error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            else:
+                response.raise_for_status()
+                return orjson.loads(response.content)
 
         except requests.exceptions.Timeout as e:
             last_error = e
-            wait_time = (2 ** attempt) * 2
-            logger.warning(f"Timeout for {model}, retry {attempt+1}/{max_retries} in {wait_time}s")
-            time.sleep(wait_time)
         except requests.exceptions.RequestException as e:
             last_error = e
-            # Don't retry client errors (4xx except 429)
-            if hasattr(e, 'response') and e.response is not None:
-                if 400 <= e.response.status_code < 500 and e.response.status_code != 429:
-                    raise
-            wait_time = (2 ** attempt) * 2
-            logger.warning(f"Request error for {model}: {e}, retry {attempt+1}/{max_retries} in {wait_time}s")
-            time.sleep(wait_time)
+            # Retryable statuses never reach raise_for_status: any HTTP error here is final
+            if getattr(e, 'response', None) is not None:
+                raise
+
+        # No sleep after the last attempt or beyond the retry budget
+        wait_time = _retry_delay(attempt, retry_after)
+        if attempt + 1 >= max_retries or slept + wait_time > RETRY_SLEEP_BUDGET:
+            break
+        logger.warning(f"OpenRouter error for {model}: {last_error}, retry {attempt+1}/{max_retries} in {wait_time:.1f}s")
+        time.sleep(wait_time)
+        slept += wait_time
 
     # All retries failed
-    raise Exception(f"Failed to get response from {model} after {max_retries} attempts: {last_error}")
+    raise Exception(f"Failed to get response from {model} after {attempt + 1} attempts: {last_error}")
 
 
-def chat_completion_stream(
+async def chat_completion_async(
     model: str,
     messages: list,
-    max_tokens: int = 4096
-) -> Generator[str, None, None]:
-    """
-    Stream chat completion from OpenRouter
-    """
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-            "X-Title": "SGC Legal AI"
-        },
-        json={
-            "model": model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "stream": True
-        },
-        stream=True,
-        timeout=120
+    stream: bool = False,
+    max_tokens: int = 4096,
+    reasoning_effort: str = None,
+    max_retries: int = 3,
+    response_format: Optional[dict] = None,
+    temperature: Optional[float] = None,
+    stop: Optional[list] = None
+) -> dict:
+    """
+    Async version of chat_completion over the shared httpx client.
+    Same parameters and retry policy, but does not block a worker thread.
+    response_format (OpenRouter structured output), temperature and stop
+    sequences are passed through when set.
+    Identical concurrent requests are coalesced into one API call; the
+    returned dict is then shared between callers and must not be mutated.
+    """
+    payload = _build_payload(
+        model, messages, stream, max_tokens, reasoning_effort,
+        response_format=response_format, temperature=temperature, stop=stop
     )
+    body = orjson.dumps(payload)
+    key = hashlib.blake2b(body, digest_size=16).hexdigest()
 
-    # Handle HTTP errors with readable messages
-    if not response.ok:
+    task = _completion_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_chat_completion_request(model, payload, body, max_retries))
+        _completion_inflight[key] = task
+        task.add_done_callback(lambda t: _finish_inflight(key, t))
+    else:
+        logger.info(f"OpenRouter request coalesced with in-flight call: {model}")
+
+    # shield: cancelling one waiter does not abort the shared request
+    return await asyncio.shield(task)
+
+
+async def _chat_completion_request(model: str, payload: dict, body: bytes, max_retries: int) -> dict:
+    """Send prepared payload with retries (body of chat_completion_async)"""
+    debug_payload = {k: v for k, v in payload.items() if k != "messages"}
+    logger.info(f"OpenRouter request: {model} | params: {debug_payload}")
+
+    client = get_async_client()
+    limiter = get_model_rate_limiter(model)
+    last_error = None
+    slept = 0.0
+    for attempt in range(max_retries):
+        retry_after = None
+        # Rate slot first: waiting for it must not occupy a concurrency slot
+        await limiter.acquire()
         try:
-            error_data = response.json()
-            error_obj = error_data.get("error", {})
-            # Handle both dict format {"error": {"message": "..."}} and string format {"error": "..."}
-            if isinstance(error_obj, dict):
-                error_msg = error_obj.get("message", response.text)
-            elif isinstance(error_obj, str):
-                error_msg = error_obj
+            # Slot is held only for the request itself, not for backoff sleeps
+            async with get_request_semaphore():
+                response = await client.post(
+                    OPENROUTER_API_URL,
+                    content=body,
+                    timeout=300.0  # Increased timeout for thinking models
+                )
+
+            # Check for rate limiting or transient server errors (retry these)
+            if response.status_code >= 400 and _should_retry(response.status_code, response.content, attempt):
+                last_error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            else:
+                response.raise_for_status()
+                return orjson.loads(response.content)
+
+        except httpx.TimeoutException as e:
+            last_error = e
+        except httpx.HTTPStatusError:
+            # Retryable statuses never reach raise_for_status: any HTTP error here is final
+            raise
+        except httpx.RequestError as e:
+            last_error = e
+
+        # No sleep after the last attempt or beyond the retry budget
+        wait_time = _retry_delay(attempt, retry_after)
+        if retry_after is not None and response.status_code == 429:
+            # Provider quota is shared: hold back every request to this model,
+            # not only this one, so they don't all hit 429 and retry together
+            limiter.pause(wait_time)
+        if attempt + 1 >= max_retries or slept + wait_time > RETRY_SLEEP_BUDGET:
+            break
+        logger.warning(f"OpenRouter error for {model}: {last_error}, retry {attempt+1}/{max_retries} in {wait_time:.1f}s")
+        await asyncio.sleep(wait_time)
+        slept += wait_time
+
+    # All retries failed
+    raise Exception(f"Failed to get response from {model} after {attempt + 1} attempts: {last_error}")
+
+
+class SSEParser:
+    """
+    Minimal server-sent events parser shared by all streaming endpoints.
+    Works on raw bytes: lines are split on b"\n" (a multi-byte character split
+    across chunks is never decoded half-way), multi-line `data:` fields are joined
+    and an event is dispatched on a blank line; comments (": OPENROUTER PROCESSING")
+    and other fields are ignored. The [DONE] sentinel ends the stream (`done`).
+    """
+
+    __slots__ = ("_buffer", "_data", "done")
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data: list = []
+        self.done = False
+
+    def _line(self, line: bytes, events: list):
+        """Process one line (without newline), appending completed event data"""
+        if line.startswith(b"data:"):
+            value = line[5:]
+            self._data.append(value[1:] if value.startswith(b" ") else value)
+        elif not line and self._data:
+            data = b"\n".join(self._data)
+            self._data.clear()
+            if data == b"[DONE]":
+                self.done = True
             else:
-                error_msg = response.text
-        except:
-            error_msg = response.text or f"HTTP {response.status_code}"
-        raise Exception(f"OpenRouter API error: {error_msg}")
-
-    for line in response.iter_lines():
-        if line:
-            line = line.decode('utf-8')
-            if line.startswith('data: '):
-                data = line[6:]
-                if data == '[DONE]':
-                    break
-                yield data
+                events.append(data)
+
+    def feed(self, chunk: bytes) -> list:
+        """Feed a raw chunk; return data (bytes) of the events it completed"""
+        events: list = []
+        buffer = self._buffer
+        buffer += chunk
+        start = 0
+        while not self.done and (end := buffer.find(b"\n", start)) != -1:
+            self._line(bytes(buffer[start:end]).rstrip(b"\r"), events)
+            start = end + 1
+        del buffer[:start]
+        return events
+
+    def flush(self) -> list:
+        """Return data of an event left unterminated at end of stream"""
+        events: list = []
+        if not self.done:
+            if self._buffer:
+                self._line(bytes(self._buffer).rstrip(b"\r"), events)
+                self._buffer.clear()
+            self._line(b"", events)
+        return events
+
+
+def iter_sse_data_from_bytes(chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """
+    Yield raw SSE event data (bytes) from raw byte chunks (e.g. requests iter_content).
+    Nothing is decoded: payloads go straight to orjson or a StreamingResponse.
+    """
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.flush()
+
+
+async def aiter_sse_data(chunks: AsyncIterable[bytes]) -> AsyncGenerator[str, None]:
+    """Yield SSE event data as text from raw byte chunks (e.g. httpx aiter_bytes) until the [DONE] sentinel"""
+    parser = SSEParser()
+    async for chunk in chunks:
+        for data in parser.feed(chunk):
+            yield data.decode("utf-8")
+        if parser.done:
+            return
+    for data in parser.flush():
+        yield data.decode("utf-8")
+
+
+def _stream_error_message(status_code: int, content: bytes, text: str) -> str:
+    """Extract readable error message from OpenRouter error response body"""
+    try:
+        error_data = orjson.loads(content)
+        error_obj = error_data.get("error", {})
+        # Handle both dict format {"error": {"message": "..."}} and string format {"error": "..."}
+        if isinstance(error_obj, dict):
+            return error_obj.get("message", text)
+        elif isinstance(error_obj, str):
+            return error_obj
+        return text
+    except Exception:
+        return text or f"HTTP {status_code}"
+
+
+def chat_completion_stream(
+    model: str,
+    messages: list,
+    max_tokens: int = 4096,
+    max_retries: int = 3
+) -> Generator[bytes, None, None]:
+    """
+    Stream chat completion from OpenRouter.
+    Yields raw SSE data payloads as bytes (ready for orjson.loads or a
+    StreamingResponse); consumers should forward them, not join them.
+    Opening the stream is retried on 429/5xx with jittered backoff;
+    once data has been yielded the stream is never restarted.
+    """
+    body = orjson.dumps({
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "stream": True
+    })
+
+    for attempt in range(max_retries):
+        response = get_sync_session().post(
+            OPENROUTER_API_URL,
+            data=body,
+            stream=True,
+            timeout=120
+        )
+        if (
+            response.status_code < 400
+            or attempt + 1 >= max_retries
+            or not _should_retry(response.status_code, response.content, attempt)
+        ):
+            break
+        wait_time = _retry_delay(attempt, response.headers.get("Retry-After"))
+        response.close()
+        logger.warning(f"OpenRouter {response.status_code} for {model} stream, retry {attempt+1}/{max_retries} in {wait_time:.1f}s")
+        time.sleep(wait_time)
+
+    # Handle HTTP errors with readable messages
+    if not response.ok:
+        raise Exception(f"OpenRouter API error: {_stream_error_message(response.status_code, response.content, response.text)}")
+
+    yield from iter_sse_data_from_bytes(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+
+async def chat_completion_stream_async(
+    model: str,
+    messages: list,
+    max_tokens: int = 4096,
+    max_retries: int = 3,
+    hold_slot: bool = False
+) -> AsyncGenerator[str, None]:
+    """
+    Async version of chat_completion_stream over the shared httpx client.
+    Same retry policy and per-model rate limiter as chat_completion_async for
+    opening the stream. By default does not take a request semaphore slot: a
+    stream can stay open for minutes. Short-lived streams pass hold_slot=True:
+    the slot is taken after the rate limiter and held only while the stream is
+    open and consumed, never during backoff sleeps.
+    """
+    client = get_async_client()
+    limiter = get_model_rate_limiter(model)
+    body = orjson.dumps({
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "stream": True
+    })
+
+    for attempt in range(max_retries):
+        # Rate slot first: waiting for it must not occupy a concurrency slot
+        await limiter.acquire()
+        async with get_request_semaphore() if hold_slot else nullcontext():
+            async with client.stream("POST", OPENROUTER_API_URL, content=body, timeout=120.0) as response:
+                # Only a 500 retry decision depends on the (small) error body
+                content = await response.aread() if response.status_code == 500 else b""
+                if response.is_error and attempt + 1 < max_retries and _should_retry(response.status_code, content, attempt):
+                    retry_after = response.headers.get("Retry-After")
+                    wait_time = _retry_delay(attempt, retry_after)
+                    if retry_after is not None and response.status_code == 429:
+                        limiter.pause(wait_time)
+                    logger.warning(f"OpenRouter {response.status_code} for {model} stream, retry {attempt+1}/{max_retries} in {wait_time:.1f}s")
+                else:
+                    # Handle HTTP errors with readable messages
+                    if response.is_error:
+                        content = await response.aread()
+                        raise Exception(f"OpenRouter API error: {_stream_error_message(response.status_code, content, response.text)}")
+
+                    async for data in aiter_sse_data(response.aiter_bytes()):
+                        yield data
+                    return
+        await asyncio.sleep(wait_time)
@@ -1,21 +1,17 @@
 """
 Perplexity Search Service - поиск актуальной юридической информации через Perplexity Sonar Pro
 """
-import requests
-import json
-from typing import Generator
+import time
+import threading
+from collections import OrderedDict
+from typing import Generator, Optional
 
 from app.config import settings
+from app.services.prompts import LEGAL_SOURCES
+from app.services.openrouter import chat_completion, chat_completion_async, chat_completion_stream
 
-SEARCH_SYSTEM_PROMPT = """Найди актуальную информацию по юридическому вопросу.
-
-ПРИОРИТЕТНЫЕ ИСТОЧНИКИ:
-- kad.arbitr.ru — Картотека арбитражных дел
-- sudact.ru — Судебные акты РФ
-- consultant.ru — КонсультантПлюс
-- garant.ru — Гарант
-- pravo.gov.ru — Официальный портал правовой информации
-- vsrf.ru — Верховный Суд РФ
+SEARCH_SYSTEM_PROMPT = f"""Найди актуальную информацию по юридическому вопросу.
+{LEGAL_SOURCES}
 
 ЧТО ИСКАТЬ:
 1. Релевантную судебную практику (номера дел, позиции судов)
@@ -30,17 +26,52 @@ SEARCH_SYSTEM_PROMPT = """Найди актуальную информацию 
 
 Если информации по теме недостаточно — укажи это явно."""
 
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Общий для всех запросов system message (не изменять)
+_SEARCH_SYSTEM_MESSAGE = {"role": "system", "content": SEARCH_SYSTEM_PROMPT}
+
+
+# Кэш ответов поиска: одинаковые запросы (номера дел, темы) не уходят в Perplexity повторно
+SEARCH_CACHE_TTL = 3600  # секунд
+SEARCH_CACHE_MAX_SIZE = 2048
+
+_search_cache: "OrderedDict[tuple, tuple[float, str]]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+
+def _search_cache_key(query: str, max_tokens: int) -> tuple:
+    """Ключ кэша: модель, нормализованный запрос и лимит токенов"""
+    return (settings.model_search, " ".join(query.lower().split()), max_tokens)
+
 
+def _search_cache_get(key: tuple) -> Optional[str]:
+    """Вернуть ответ из кэша, если он ещё не устарел"""
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > SEARCH_CACHE_TTL:
+            del _search_cache[key]
+            return None
+        _search_cache.move_to_end(key)
+        return result
 
-def _get_headers() -> dict:
-    """Возвращает заголовки для запросов к OpenRouter"""
-    return {
-        "Authorization": f"Bearer {settings.openrouter_api_key}",
-        "HTTP-Referer": "https://sgc-legal-ai.vercel.app",
-        "X-Title": "SGC Legal AI",
-        "Content-Type": "application/json"
-    }
+
+def _search_cache_put(key: tuple, result: str):
+    """Сохранить ответ в кэш, вытесняя самые старые записи"""
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), result)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_MAX_SIZE:
+            _search_cache.popitem(last=False)
+
+
+def _search_messages(query: str) -> list:
+    """Сообщения запроса к Perplexity с системным промптом поиска"""
+    return [
+        _SEARCH_SYSTEM_MESSAGE,
+        {"role": "user", "content": query}
+    ]
 
 
 def search(query: str, max_tokens: int = 2048) -> str:
@@ -54,37 +85,41 @@ def search(query: str, max_tokens: int = 2048) -> str:
     Returns:
         Текст ответа от Perplexity
     """
-    payload = {
-        "model": settings.model_search,
-        "messages": [
-            {"role": "system", "content": SEARCH_SYSTEM_PROMPT},
-            {"role": "user", "content": query}
-        ],
-        "max_tokens": max_tokens,
-        "stream": False
-    }
-
-    response = requests.post(
-        OPENROUTER_API_URL,
-        headers=_get_headers(),
-        json=payload,
-        timeout=60
-    )
-
-    # Handle HTTP errors with readable messages
-    if not response.ok:
-        try:
-            error_data = response.json()
-            error_msg = error_data.get("error", {}).get("message", response.text)
-        except:
-            error_msg = response.text or f"HTTP {response.status_code}"
-        raise Exception(f"Search API error: {error_msg}")
-
-    data = response.json()
-    return data["choices"][0]["message"]["content"]
-
-
-def search_stream(query: str, max_tokens: int = 2048) -> Generator[str, None, None]:
+    cache_key = _search_cache_key(query, max_tokens)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = chat_completion(settings.model_search, _search_messages(query), max_tokens=max_tokens)
+    result = data["choices"][0]["message"]["content"]
+    _search_cache_put(cache_key, result)
+    return result
+
+
+async def search_async(query: str, max_tokens: int = 2048) -> str:
+    """
+    Асинхронный поиск через Perplexity Sonar Pro (общий httpx клиент, общий кэш с search).
+    Одновременные одинаковые запросы объединяет chat_completion_async.
+
+    Args:
+        query: Поисковый запрос
+        max_tokens: Максимальное количество токенов ответа
+
+    Returns:
+        Текст ответа от Perplexity
+    """
+    cache_key = _search_cache_key(query, max_tokens)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = await chat_completion_async(settings.model_search, _search_messages(query), max_tokens=max_tokens)
+    result = data["choices"][0]["message"]["content"]
+    _search_cache_put(cache_key, result)
+    return result
+
+
+def search_stream(query: str, max_tokens: int = 2048) -> Generator[bytes, None, None]:
     """
     Потоковый поиск через Perplexity Sonar Pro.
 
@@ -93,32 +128,6 @@ def search_stream(query: str, max_tokens: int = 2048) -> Generator[str, None, No
         max_tokens: Максимальное количество токенов ответа
 
     Yields:
-        Чанки ответа в формате JSON
+        Чанки ответа в формате JSON (bytes, передаются дальше без декодирования)
     """
-    payload = {
-        "model": settings.model_search,
-        "messages": [
-            {"role": "system", "content": SEARCH_SYSTEM_PROMPT},
-            {"role": "user", "content": query}
-        ],
-        "max_tokens": max_tokens,
-        "stream": True
-    }
-
-    response = requests.post(
-        OPENROUTER_API_URL,
-        headers=_get_headers(),
-        json=payload,
-        stream=True,
-        timeout=60
-    )
-    response.raise_for_status()
-
-    for line in response.iter_lines():
-        if line:
-            line_text = line.decode("utf-8")
-            if line_text.startswith("data: "):
-                data_str = line_text[6:]
-                if data_str.strip() == "[DONE]":
-                    break
-                yield data_str
+    yield from chat_completion_stream(settings.model_search, _search_messages(query), max_tokens=max_tokens)
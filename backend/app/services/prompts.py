@@ -5,6 +5,13 @@ from typing import Optional
 from app.services.task_classifier import TaskType
 
 
+# ============================================================================
+# ИСТОЧНИКИ ДЛЯ ПОИСКА - общая часть промптов Perplexity
+# ============================================================================
+
+LEGAL_SOURCES = "Приоритетные источники: kad.arbitr.ru, sudact.ru, vsrf.ru, arbitr.ru, pravo.gov.ru, consultant.ru, garant.ru."
+
+
 # ============================================================================
 # ПРАВОВОЕ ЗАКЛЮЧЕНИЕ (legal_opinion) - существующий промпт
 # ============================================================================
@@ -2,11 +2,15 @@
 Task Classifier Service
 Автоматическая классификация типа задачи пользователя для выбора оптимального системного промпта
 """
+import re
+import hashlib
 import logging
+from collections import OrderedDict
 from enum import Enum
 from typing import Optional
 from app.config import settings
-from app.services.openrouter import chat_completion
+from app.services.openrouter import chat_completion_async
+from app.services.text_utils import truncate_middle
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +46,23 @@ CLASSIFIER_PROMPT = """Ты — классификатор задач. Опре
 
 Ответь ТОЛЬКО одним словом из списка: legal_opinion, summarize, draft, improve, rewrite, general"""
 
+# Общий для всех запросов system message (не изменять: список сообщений
+# создаётся на каждый запрос, сам словарь - один)
+_CLASSIFIER_SYSTEM_MESSAGE = {"role": "system", "content": CLASSIFIER_PROMPT}
+
+
+# Лимит ответа классификатора: самая длинная метка (legal_opinion) - несколько токенов
+CLASSIFIER_MAX_TOKENS = 8
+
+# Лимит запроса, передаваемого классификатору: для выбора типа задачи хватает
+# начала и конца, длинная середина (вставленный документ) усекается
+CLASSIFY_MESSAGE_MAX_CHARS = 2000
+
+# Разбор ответа классификатора: метка целым словом (длинные метки первыми)
+_TASK_TYPE_RE = re.compile(
+    r"\b(" + "|".join(sorted((t.value for t in TaskType), key=len, reverse=True)) + r")\b"
+)
+_TASK_TYPE_BY_VALUE = {t.value: t for t in TaskType}
 
 # Русские названия типов задач для отображения
 TASK_TYPE_LABELS = {
@@ -54,7 +75,76 @@ TASK_TYPE_LABELS = {
 }
 
 
-def classify_task(
+# Быстрые правила по ключевым словам (из ПРАВИЛ промпта классификатора):
+# однозначные запросы классифицируются без вызова LLM.
+# Третий элемент - правило действует только при загруженном файле.
+# Объект действия должен идти сразу за глаголом (допускается одно прилагательное):
+# "напиши заключение по договору" - не draft, а решение LLM
+_ADJECTIVE = r"(?:[а-яё]+(?:ый|ий|ой|ая|яя|ое|ее|ую|юю|ые|ие)[\s,]+)?"
+_DRAFT_NOUNS = r"(?:договор|письм|заявлени|жалоб|иск|претензи|ходатайств|соглашени|доверенност|уведомлени)"
+_IMPROVE_NOUNS = r"(?:текст|документ|договор|письм|формулировк|абзац|пункт|раздел|редакци)"
+_OPINION_NOUNS = r"(?:заключени|анализ|позици|мнени)"
+
+_FAST_RULES = [
+    (re.compile(r"\b(?:перепиши|перефразируй)\b", re.IGNORECASE), TaskType.REWRITE, False),
+    (
+        re.compile(r"\b(?:улучши|исправь|отредактируй)[\s,]+" + _ADJECTIVE + _IMPROVE_NOUNS, re.IGNORECASE),
+        TaskType.IMPROVE,
+        False
+    ),
+    (
+        re.compile(r"\b(?:улучши|исправь|отредактируй)[\s,]+(?:его|её|ее|их|этот|эту|это)\b", re.IGNORECASE),
+        TaskType.IMPROVE,
+        True
+    ),
+    (
+        re.compile(
+            r"\b(?:напиши|составь|подготовь|сформируй)[\s,]+"
+            r"(?!" + _ADJECTIVE + _OPINION_NOUNS + r")" + _ADJECTIVE + _DRAFT_NOUNS,
+            re.IGNORECASE
+        ),
+        TaskType.DRAFT,
+        False
+    ),
+    (re.compile(r"\b(?:кратко|резюме|саммари\w*|выдели главное)\b", re.IGNORECASE), TaskType.SUMMARIZE, True),
+]
+
+
+def _classify_by_rules(user_message: str, has_file_context: bool) -> Optional[TaskType]:
+    """
+    Тип задачи по ключевым словам; None - если правил нет, они противоречат друг
+    другу или запрос содержит вопрос (правовой вопрос/консультацию решает LLM)
+    """
+    if "?" in user_message:
+        return None
+    matched = {
+        task_type
+        for pattern, task_type, needs_file in _FAST_RULES
+        if (has_file_context or not needs_file) and pattern.search(user_message)
+    }
+    return matched.pop() if len(matched) == 1 else None
+
+
+# LRU-кэш классификации: типовые формулировки ("сделай резюме") не уходят в LLM повторно.
+# Используется только из event loop, поэтому без блокировки
+CLASSIFY_CACHE_MAX_SIZE = 4096
+
+_classify_cache: "OrderedDict[tuple, TaskType]" = OrderedDict()
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+
+def _classify_cache_key(user_message: str, has_file_context: bool) -> tuple:
+    """
+    Ключ кэша: хэш того же окна запроса, что уходит в LLM (truncate_middle),
+    без регистра, пунктуации и лишних пробелов + наличие файла
+    """
+    window = truncate_middle(user_message, CLASSIFY_MESSAGE_MAX_CHARS)
+    normalized = " ".join(_PUNCTUATION_RE.sub(" ", window.lower()).split())
+    return (hashlib.blake2b(normalized.encode(), digest_size=16).digest(), has_file_context)
+
+
+async def classify_task(
     user_message: str,
     has_file_context: bool = False,
     file_name: Optional[str] = None
@@ -70,32 +160,49 @@ def classify_task(
     Returns:
         TaskType: Тип задачи
     """
+    task_type = _classify_by_rules(user_message, has_file_context)
+    if task_type is not None:
+        logger.info(f"Task classification by rules: {task_type.value}")
+        return task_type
+
+    cache_key = _classify_cache_key(user_message, has_file_context)
+    cached = _classify_cache.get(cache_key)
+    if cached is not None:
+        _classify_cache.move_to_end(cache_key)
+        return cached
+
     # Формируем контекст для классификатора
-    context = user_message
+    context = truncate_middle(user_message, CLASSIFY_MESSAGE_MAX_CHARS)
     if has_file_context:
         file_info = f" (с файлом: {file_name})" if file_name else " (с загруженным документом)"
-        context = f"Запрос пользователя{file_info}: {user_message}"
+        context = f"Запрос пользователя{file_info}: {context}"
 
     messages = [
-        {"role": "system", "content": CLASSIFIER_PROMPT},
+        _CLASSIFIER_SYSTEM_MESSAGE,
         {"role": "user", "content": context}
     ]
 
     try:
-        response = chat_completion(
+        response = await chat_completion_async(
             model=settings.model_fast,  # Используем быструю модель
             messages=messages,
-            max_tokens=20,  # Нужен только один токен
-            stream=False
+            max_tokens=CLASSIFIER_MAX_TOKENS,
+            stream=False,
+            temperature=0,  # Детерминированный выбор метки
+            stop=["\n"]  # Метка - одна строка, дальше не генерируем
         )
 
         result = response.get("choices", [{}])[0].get("message", {}).get("content", "").strip().lower()
         logger.info(f"Task classification result: {result}")
 
         # Парсим результат
-        for task_type in TaskType:
-            if task_type.value in result:
-                return task_type
+        match = _TASK_TYPE_RE.search(result)
+        if match:
+            task_type = _TASK_TYPE_BY_VALUE[match.group(1)]
+            _classify_cache[cache_key] = task_type
+            if len(_classify_cache) > CLASSIFY_CACHE_MAX_SIZE:
+                _classify_cache.popitem(last=False)
+            return task_type
 
         # По умолчанию — правовое заключение (для обратной совместимости)
         logger.warning(f"Unknown task type: {result}, defaulting to legal_opinion")
@@ -0,0 +1,17 @@
+"""
+Вспомогательные функции для работы с текстом
+"""
+
+TRUNCATION_MARKER = "\n…[усечено]…\n"
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """
+    Ограничить вспомогательный ввод модели (контекст поиска, запрос классификатору)
+    примерно max_chars символами: начало и конец сохраняются, середина вырезается.
+    Короткий текст возвращается без изменений
+    """
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return text[:half] + TRUNCATION_MARKER + text[-half:]
@@ -1,53 +1,47 @@
 """
 Web Search Service using Perplexity via OpenRouter
 """
-import asyncio
 from typing import Generator
-from app.services.openrouter import chat_completion, chat_completion_stream
+from app.services.openrouter import chat_completion, chat_completion_async, chat_completion_stream
+from app.services.text_utils import truncate_middle
+from app.services.prompts import LEGAL_SOURCES
 
 
 # Модель с поиском в интернете
 SEARCH_MODEL = "perplexity/sonar-pro-search"
 
-
-def web_search(query: str, context: str = "") -> dict:
-    """
-    Выполнить поиск в интернете через Perplexity Sonar Pro
-
-    Args:
-        query: Поисковый запрос
-        context: Дополнительный контекст для запроса
-
-    Returns:
-        dict с результатом поиска
-    """
-    system_prompt = """Ты - помощник для поиска юридической информации в интернете.
+# Системный промпт поиска
+SEARCH_SYSTEM_PROMPT = f"""Ты - помощник для поиска юридической информации в интернете.
 Отвечай на русском языке.
+{LEGAL_SOURCES}
+Форматируй ответ структурированно с указанием найденных фактов и ссылок."""
 
-Приоритетные источники для судебной практики и законодательства:
-- sudact.ru - Судебные акты РФ
-- kad.arbitr.ru - Картотека арбитражных дел
-- consultant.ru - КонсультантПлюс
-- garant.ru - Гарант
-- vsrf.ru - Верховный Суд РФ
-- arbitr.ru - Федеральные арбитражные суды
-- pravo.gov.ru - Официальный портал правовой информации
+# Лимит контекста поискового запроса: вставленный целиком документ не должен
+# превращаться в десятки тысяч токенов на каждый поиск (середина усекается)
+SEARCH_CONTEXT_MAX_CHARS = 8000
 
-Форматируй ответ структурированно с указанием найденных фактов и ссылок."""
+# Общий для всех запросов system message (не изменять: список сообщений
+# создаётся на каждый запрос, сам словарь - один)
+_SEARCH_SYSTEM_MESSAGE = {"role": "system", "content": SEARCH_SYSTEM_PROMPT}
 
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
+
+def _search_messages(query: str, context: str) -> list:
+    """Сообщения для поискового запроса (общие для всех вариантов поиска)"""
+    messages = [_SEARCH_SYSTEM_MESSAGE]
 
     if context:
         messages.append({
             "role": "user",
-            "content": f"Контекст: {context}\n\nПоисковый запрос: {query}"
+            "content": f"Контекст: {truncate_middle(context, SEARCH_CONTEXT_MAX_CHARS)}\n\nПоисковый запрос: {query}"
         })
     else:
         messages.append({"role": "user", "content": query})
 
-    response = chat_completion(SEARCH_MODEL, messages, stream=False, max_tokens=4096)
+    return messages
+
+
+def _search_result(response: dict) -> dict:
+    """Результат поиска из ответа OpenRouter"""
     content = response["choices"][0]["message"]["content"]
     tokens = response.get("usage", {}).get("total_tokens", 0)
 
@@ -58,49 +52,41 @@ def web_search(query: str, context: str = "") -> dict:
     }
 
 
-def web_search_stream(query: str, context: str = "") -> Generator[str, None, None]:
+def web_search(query: str, context: str = "") -> dict:
     """
-    Стриминговый поиск в интернете
+    Выполнить поиск в интернете через Perplexity Sonar Pro
 
     Args:
         query: Поисковый запрос
-        context: Дополнительный контекст
+        context: Дополнительный контекст для запроса
 
-    Yields:
-        Чанки ответа
+    Returns:
+        dict с результатом поиска
     """
-    system_prompt = """Ты - помощник для поиска юридической информации в интернете.
-Отвечай на русском языке.
-
-Приоритетные источники для судебной практики и законодательства:
-- sudact.ru - Судебные акты РФ
-- kad.arbitr.ru - Картотека арбитражных дел
-- consultant.ru - КонсультантПлюс
-- garant.ru - Гарант
-- vsrf.ru - Верховный Суд РФ
-- arbitr.ru - Федеральные арбитражные суды
-- pravo.gov.ru - Официальный портал правовой информации
+    messages = _search_messages(query, context)
+    response = chat_completion(SEARCH_MODEL, messages, stream=False, max_tokens=4096)
+    return _search_result(response)
 
-Форматируй ответ структурированно с указанием найденных фактов и ссылок."""
 
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
+def web_search_stream(query: str, context: str = "") -> Generator[bytes, None, None]:
+    """
+    Стриминговый поиск в интернете
 
-    if context:
-        messages.append({
-            "role": "user",
-            "content": f"Контекст: {context}\n\nПоисковый запрос: {query}"
-        })
-    else:
-        messages.append({"role": "user", "content": query})
+    Args:
+        query: Поисковый запрос
+        context: Дополнительный контекст
 
+    Yields:
+        Чанки ответа (сырые данные SSE в bytes, без буферизации всего ответа)
+    """
+    messages = _search_messages(query, context)
     yield from chat_completion_stream(SEARCH_MODEL, messages, max_tokens=4096)
 
 
 async def async_web_search(query: str, context: str = "") -> dict:
     """
-    Асинхронный поиск в интернете
+    Асинхронный поиск в интернете (общий httpx клиент, без потока-исполнителя)
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: web_search(query, context))
+    messages = _search_messages(query, context)
+    response = await chat_completion_async(SEARCH_MODEL, messages, stream=False, max_tokens=4096)
+    return _search_result(response)